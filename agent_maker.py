@@ -1,14 +1,21 @@
 import google.generativeai as genai
 import json
 import os
-from pymongo import MongoClient
 from datetime import datetime
 import asyncio
 import anthropic
+from functools import lru_cache
+from mongo import get_db
 
 genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-db = MongoClient(os.getenv("MONGODB_URI")).vibeflows
+db = get_db()  # Shared, lazily connecting pool
 claude_client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+async_claude_client = anthropic.AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+
+@lru_cache(maxsize=1)
+def get_gemini_model():
+    """Return the Gemini model used for agent design, built once per process"""
+    return genai.GenerativeModel("gemini-2.5-pro")
 
 AGENT_PROMPT = """You are an expert agent architect. 
 Create an agent specification for this node:
@@ -206,192 +213,287 @@ EDGE_SCHEMA = {
     "animated": "boolean"
 }
 
-def agent_developer(input_data: dict) -> dict:
+def _gemini_agent_prompt(input_data: dict) -> str:
+    """Build the Gemini agent prompt (reads credential names from the database)"""
+    system = _claude4_agent_prompt(input_data.get("requirements", ""))
+    
+    # Prepare input data context for Gemini
+    context = "Input Data: " + str(input_data)
+    
+    # Add system prompt and input data context
+    return f"{system}\n\n{context}\n\nYou are an expert agent architect. Return only valid JSON matching the agent schema."
+
+def _gemini_stream_echo(emit):
+    """
+    Return a feed(chunk_text) function that passes streamed Gemini text to emit,
+    replacing the agent JSON itself with short progress notes.
+    """
+    state = {"json_mode": False, "brace_count": 0}
+    
+    def feed(chunk_text):
+        # Detect start of JSON in various formats
+        if not state["json_mode"]:
+            # Look for JSON indicators
+            if (chunk_text.strip().startswith('{"') or 
+                chunk_text.strip().startswith('{\n') or
+                '{"' in chunk_text or
+                "```json" in chunk_text.lower() or
+                chunk_text.strip().startswith('{') and len(chunk_text.strip()) > 1):
+                state["json_mode"] = True
+                state["brace_count"] = 0
+                emit("\n🔧 Generating agent specification...\n⏳ Please wait while the agent is being created...\n")
+        
+        # Count braces to track JSON structure
+        if state["json_mode"]:
+            state["brace_count"] += chunk_text.count('{')
+            state["brace_count"] -= chunk_text.count('}')
+            
+            # Check if JSON is complete
+            if state["brace_count"] <= 0 and (chunk_text.endswith('}') or 
+                                              chunk_text.strip().endswith('}') or
+                                              "```" in chunk_text):
+                state["json_mode"] = False
+                emit("✅ Agent specification complete!\n")
+        
+        # Only print if NOT in JSON mode
+        if not state["json_mode"]:
+            emit(chunk_text)
+    
+    return feed
+
+def _parse_gemini_agent_spec(full_text: str) -> dict:
+    """Parse the agent JSON streamed by Gemini, repairing common issues or falling back to a minimal agent"""
+    text = full_text.strip()
+    
+    # Clean response of markdown code blocks if present
+    if "```json" in text:
+        text = text.split("```json")[1].split("```")[0].strip()
+    elif "```" in text:
+        text = text.split("```")[1].split("```")[0].strip()
+    
+    # Parse JSON with error handling
+    try:
+        agent_spec = json.loads(text)
+    except json.JSONDecodeError as e:
+        print(f"❌ Failed to parse agent JSON: {str(e)}")
+        print(f"📄 Raw response length: {len(text)} characters")
+        print(f"📄 Raw response (first 500 chars):")
+        print(text[:500])
+        print("\n📄 Raw response (last 500 chars):")
+        print(text[-500:])
+        
+        # Save problematic response for debugging
+        debug_file = f"debug_agent_response_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.json"
+        with open(debug_file, 'w') as f:
+            f.write(text)
+        print(f"💾 Saved raw response to {debug_file}")
+        
+        # Try to fix common JSON issues
+        print("🔧 Attempting to fix JSON...")
+        
+        # Fix 1: Replace single quotes with double quotes
+        fixed_text = text.replace("'", '"')
+        
+        # Fix 2: Fix Python boolean/null values
+        fixed_text = fixed_text.replace('True', 'true').replace('False', 'false').replace('None', 'null')
+        
+        # Fix 3: Try to handle unterminated strings by finding the error location
+        try:
+            # Try to find where the JSON breaks
+            lines = fixed_text.split('\n')
+            if len(lines) >= 39:  # Error was at line 39
+                print(f"🔍 Problem line 39: {lines[38]}")
+            
+            # Fix 4: Try to escape unescaped quotes in strings
+            import re
+            # Find content within double quotes and escape internal quotes
+            def fix_quotes(match):
+                content = match.group(1)
+                # Escape internal quotes that aren't already escaped
+                content = re.sub(r'(?<!\\)"', r'\\"', content)
+                return f'"{content}"'
+            
+            # Apply quote fixing to string values
+            fixed_text = re.sub(r'"([^"]*(?:[^"\\]|\\.)*)(?="[,\]}])', fix_quotes, fixed_text)
+            
+            agent_spec = json.loads(fixed_text)
+            print("✅ Successfully fixed JSON!")
+            
+        except json.JSONDecodeError as e2:
+            print(f"❌ Still failed after fixes: {str(e2)}")
+            
+            # Try one more approach - truncate at the error position and see if we can salvage
+            try:
+                error_pos = e.pos if hasattr(e, 'pos') else 2178
+                truncated = text[:error_pos] + '}'  # Try to close the JSON
+                agent_spec = json.loads(truncated)
+                print("✅ Partially recovered JSON by truncation!")
+            except:
+                print("❌ Could not recover JSON. Generating minimal fallback agent.")
+                agent_spec = dict(FALLBACK_AGENT_SPEC)
+    
+    return agent_spec
+
+def agent_developer(input_data: dict, on_chunk=None) -> dict:
     """
     Design an executable agent from a flow node specification
     
     Args:
         input_data: Dictionary containing:
             - requirements: Stringified agent node or additional requirements
+        on_chunk: Optional callback receiving each piece of streamed progress text
+            (defaults to printing it)
         
     Returns:
         Dictionary containing agent specification and agent_id
     """
 
-    requirements = input_data.get("requirements", "")
+    emit = on_chunk or (lambda text: print(text, end="", flush=True))
     
     try:
-        # Get available resources
-        tools = list(db.tools.find({}))
-        integrations = list(db.integrations.find({}))
-        credentials = list(db.credentials.find({}, {"name": 1}))
-        
-        system = AGENT_PROMPT.format(
-            requirements=requirements,
-            tools="",
-            integrations="",
-            credentials=str(credentials),
-            agent_schema=str(AGENT_SCHEMA),
-            node_schema=json.dumps(NODE_SCHEMA, indent=2),
-            edge_schema=json.dumps(EDGE_SCHEMA, indent=2),
-            tool_schema=json.dumps(TOOL_NODE_SCHEMA, indent=2),
-            integration_schema=json.dumps(INTEGRATION_SCHEMA, indent=2),
-            mcp_client_schema=json.dumps(MCP_CLIENT_SCHEMA, indent=2),
-            llm_node_schema=json.dumps(LLM_NODE_SCHEMA, indent=2)
-        )
-        
-        # Prepare input data context for Gemini
-        context = "Input Data: " + str(input_data)
-        
-        # Add system prompt and input data context
-        prompt = f"{system}\n\n{context}\n\nYou are an expert agent architect. Return only valid JSON matching the agent schema."
+        prompt = _gemini_agent_prompt(input_data)
         
-        print("🤖 Streaming AI response:")
-        print("=" * 50)
+        emit("🤖 Streaming AI response:\n" + "=" * 50 + "\n")
         
         # Use streaming to see the response as it comes in
-        response = genai.GenerativeModel("gemini-2.5-pro").generate_content(
+        response = get_gemini_model().generate_content(
             prompt, 
             stream=True
         )
         
         # Collect and print the streaming response (but completely block JSON)
         full_text = ""
-        json_mode = False
-        brace_count = 0
+        feed = _gemini_stream_echo(emit)
         
         for chunk in response:
             if chunk.text:
-                chunk_text = chunk.text
-                full_text += chunk_text
-                
-                # Detect start of JSON in various formats
-                if not json_mode:
-                    # Look for JSON indicators
-                    if (chunk_text.strip().startswith('{"') or 
-                        chunk_text.strip().startswith('{\n') or
-                        '{"' in chunk_text or
-                        "```json" in chunk_text.lower() or
-                        chunk_text.strip().startswith('{') and len(chunk_text.strip()) > 1):
-                        json_mode = True
-                        brace_count = 0
-                        print("\n🔧 Generating agent specification...")
-                        print("⏳ Please wait while the agent is being created...")
-                
-                # Count braces to track JSON structure
-                if json_mode:
-                    brace_count += chunk_text.count('{')
-                    brace_count -= chunk_text.count('}')
-                    
-                    # Check if JSON is complete
-                    if brace_count <= 0 and (chunk_text.endswith('}') or 
-                                           chunk_text.strip().endswith('}') or
-                                           "```" in chunk_text):
-                        json_mode = False
-                        print("✅ Agent specification complete!")
-                
-                # Only print if NOT in JSON mode
-                if not json_mode:
-                    print(chunk_text, end="", flush=True)
-        
-        print("\n" + "=" * 50)
-        print("🤖 AI response complete!")
-        
-        text = full_text.strip()
-        
-        # Clean response of markdown code blocks if present
-        if "```json" in text:
-            text = text.split("```json")[1].split("```")[0].strip()
-        elif "```" in text:
-            text = text.split("```")[1].split("```")[0].strip()
-        
-        # Parse JSON with error handling
-        try:
-            agent_spec = json.loads(text)
-        except json.JSONDecodeError as e:
-            print(f"❌ Failed to parse agent JSON: {str(e)}")
-            print(f"📄 Raw response length: {len(text)} characters")
-            print(f"📄 Raw response (first 500 chars):")
-            print(text[:500])
-            print("\n📄 Raw response (last 500 chars):")
-            print(text[-500:])
-            
-            # Save problematic response for debugging
-            debug_file = f"debug_agent_response_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.json"
-            with open(debug_file, 'w') as f:
-                f.write(text)
-            print(f"💾 Saved raw response to {debug_file}")
-            
-            # Try to fix common JSON issues
-            print("🔧 Attempting to fix JSON...")
-            
-            # Fix 1: Replace single quotes with double quotes
-            fixed_text = text.replace("'", '"')
-            
-            # Fix 2: Fix Python boolean/null values
-            fixed_text = fixed_text.replace('True', 'true').replace('False', 'false').replace('None', 'null')
-            
-            # Fix 3: Try to handle unterminated strings by finding the error location
-            try:
-                # Try to find where the JSON breaks
-                lines = fixed_text.split('\n')
-                if len(lines) >= 39:  # Error was at line 39
-                    print(f"🔍 Problem line 39: {lines[38]}")
-                
-                # Fix 4: Try to escape unescaped quotes in strings
-                import re
-                # Find content within double quotes and escape internal quotes
-                def fix_quotes(match):
-                    content = match.group(1)
-                    # Escape internal quotes that aren't already escaped
-                    content = re.sub(r'(?<!\\)"', r'\\"', content)
-                    return f'"{content}"'
-                
-                # Apply quote fixing to string values
-                fixed_text = re.sub(r'"([^"]*(?:[^"\\]|\\.)*)(?="[,\]}])', fix_quotes, fixed_text)
-                
-                agent_spec = json.loads(fixed_text)
-                print("✅ Successfully fixed JSON!")
-                
-            except json.JSONDecodeError as e2:
-                print(f"❌ Still failed after fixes: {str(e2)}")
-                
-                # Try one more approach - truncate at the error position and see if we can salvage
-                try:
-                    error_pos = e.pos if hasattr(e, 'pos') else 2178
-                    truncated = text[:error_pos] + '}'  # Try to close the JSON
-                    agent_spec = json.loads(truncated)
-                    print("✅ Partially recovered JSON by truncation!")
-                except:
-                    print("❌ Could not recover JSON. Generating minimal fallback agent.")
-                    # Create a minimal fallback agent
-                    agent_spec = {
-                        "name": "Fallback Agent",
-                        "description": "Generated due to JSON parsing error",
-                        "nodes": [],
-                        "edges": [],
-                        "input_schema": {},
-                        "output_schema": {},
-                        "function": "def fallback_agent(input_data):\n    return {'error': 'Agent generation failed', 'input': input_data}",
-                        "tools": [],
-                        "integrations": [],
-                        "mcp_clients": [],
-                        "status": "error"
-                    }
-        
-        # Store agent in database
-        result = db.agents.insert_one({
-            **agent_spec,
-            "created_at": datetime.utcnow(),
-            "status": "ready"
-        })
-        
-        return {**agent_spec, "agent_id": str(result.inserted_id)}
+                full_text += chunk.text
+                feed(chunk.text)
+        
+        emit("\n" + "=" * 50 + "\n🤖 AI response complete!\n")
+        
+        agent_spec = _parse_gemini_agent_spec(full_text)
+        agent_id = _store_agent(agent_spec)
+        
+        return {**agent_spec, "agent_id": agent_id}
         
     except Exception as e:
         print(f"❌ Error in agent_developer: {str(e)}")
         raise
 
+async def agent_developer_async(input_data: dict, on_chunk=None) -> dict:
+    """
+    Async variant of agent_developer for running many agents concurrently.
+    The Gemini stream is awaited; JSON parsing and Mongo reads/writes run in a thread.
+    
+    Args:
+        input_data: Dictionary containing:
+            - requirements: Stringified agent node or additional requirements
+        on_chunk: Optional callback receiving each piece of streamed progress text
+            (defaults to printing it)
+        
+    Returns:
+        Dictionary containing agent specification and agent_id
+    """
+
+    emit = on_chunk or (lambda text: print(text, end="", flush=True))
+    
+    try:
+        prompt = await asyncio.to_thread(_gemini_agent_prompt, input_data)
+        
+        emit("🤖 Streaming AI response:\n" + "=" * 50 + "\n")
+        
+        response = await get_gemini_model().generate_content_async(
+            prompt,
+            stream=True
+        )
+        
+        full_text = ""
+        feed = _gemini_stream_echo(emit)
+        
+        async for chunk in response:
+            if chunk.text:
+                full_text += chunk.text
+                feed(chunk.text)
+        
+        emit("\n" + "=" * 50 + "\n🤖 AI response complete!\n")
+        
+        # JSON repair may write a debug file, so it runs in a thread with the store
+        agent_spec = await asyncio.to_thread(_parse_gemini_agent_spec, full_text)
+        agent_id = await asyncio.to_thread(_store_agent, agent_spec)
+        
+        return {**agent_spec, "agent_id": agent_id}
+        
+    except Exception as e:
+        print(f"❌ Error in agent_developer_async: {str(e)}")
+        raise
+
+CLAUDE4_SYSTEM_PROMPT = """You are an expert agent architect. Create an agent specification for the given node requirements.
+
+Return ONLY valid JSON matching the agent schema. No markdown, no explanations."""
+
+FALLBACK_AGENT_SPEC = {
+    "name": "Fallback Agent",
+    "description": "Generated due to JSON parsing error",
+    "nodes": [],
+    "edges": [],
+    "input_schema": {},
+    "output_schema": {},
+    "function": "def fallback_agent(input_data):\n    return {'error': 'Agent generation failed', 'input': input_data}",
+    "tools": [],
+    "integrations": [],
+    "mcp_clients": [],
+    "status": "error"
+}
+
+def _claude4_agent_prompt(requirements: str) -> str:
+    """Build the Claude 4 agent prompt (reads credential names from the database)"""
+    credentials = list(db.credentials.find({}, {"name": 1}))
+    
+    return AGENT_PROMPT.format(
+        requirements=requirements,
+        tools="",
+        integrations="",
+        credentials=str(credentials),
+        agent_schema=str(AGENT_SCHEMA),
+        node_schema=json.dumps(NODE_SCHEMA, indent=2),
+        edge_schema=json.dumps(EDGE_SCHEMA, indent=2),
+        tool_schema=json.dumps(TOOL_NODE_SCHEMA, indent=2),
+        integration_schema=json.dumps(INTEGRATION_SCHEMA, indent=2),
+        mcp_client_schema=json.dumps(MCP_CLIENT_SCHEMA, indent=2),
+        llm_node_schema=json.dumps(LLM_NODE_SCHEMA, indent=2)
+    )
+
+def _parse_claude4_agent_spec(text: str) -> dict:
+    """Parse the agent JSON returned by Claude 4, falling back to a minimal agent"""
+    # Clean response of markdown code blocks if present
+    if "```json" in text:
+        text = text.split("```json")[1].split("```")[0].strip()
+    elif "```" in text:
+        text = text.split("```")[1].split("```")[0].strip()
+    
+    # Parse JSON with error handling
+    try:
+        agent_spec = json.loads(text)
+        print("✅ Agent specification generated successfully with Claude 4!")
+        return agent_spec
+    except json.JSONDecodeError as e:
+        print(f"❌ Failed to parse agent JSON: {str(e)}")
+        return dict(FALLBACK_AGENT_SPEC)
+
+def _store_agent(agent_spec: dict, user_id=None) -> str:
+    """Store an agent spec with user_id and return its agent_id"""
+    agent_data = {
+        **agent_spec,
+        "created_at": datetime.utcnow(),
+        "status": "ready"
+    }
+    if user_id:
+        agent_data["user_id"] = user_id
+        
+    result = db.agents.insert_one(agent_data)
+    return str(result.inserted_id)
+
 def agent_developer_claude4(input_data: dict) -> dict:
     """
     Design an executable agent from a flow node specification using Claude 4
@@ -409,28 +511,7 @@ def agent_developer_claude4(input_data: dict) -> dict:
     user_id = input_data.get("user_id")
     
     try:
-        # Get available resources
-        tools = list(db.tools.find({}))
-        integrations = list(db.integrations.find({}))
-        credentials = list(db.credentials.find({}, {"name": 1}))
-        
-        system_prompt = """You are an expert agent architect. Create an agent specification for the given node requirements.
-
-Return ONLY valid JSON matching the agent schema. No markdown, no explanations."""
-        
-        prompt = AGENT_PROMPT.format(
-            requirements=requirements,
-            tools="",
-            integrations="",
-            credentials=str(credentials),
-            agent_schema=str(AGENT_SCHEMA),
-            node_schema=json.dumps(NODE_SCHEMA, indent=2),
-            edge_schema=json.dumps(EDGE_SCHEMA, indent=2),
-            tool_schema=json.dumps(TOOL_NODE_SCHEMA, indent=2),
-            integration_schema=json.dumps(INTEGRATION_SCHEMA, indent=2),
-            mcp_client_schema=json.dumps(MCP_CLIENT_SCHEMA, indent=2),
-            llm_node_schema=json.dumps(LLM_NODE_SCHEMA, indent=2)
-        )
+        prompt = _claude4_agent_prompt(requirements)
         
         print("🤖 Generating agent with Claude 4...")
         
@@ -438,52 +519,53 @@ Return ONLY valid JSON matching the agent schema. No markdown, no explanations."
         response = claude_client.messages.create(
             model="claude-sonnet-4-20250514",
             max_tokens=8000,
-            system=system_prompt,
+            system=CLAUDE4_SYSTEM_PROMPT,
             messages=[{"role": "user", "content": prompt}]
         )
         
-        text = response.content[0].text.strip()
+        agent_spec = _parse_claude4_agent_spec(response.content[0].text.strip())
+        agent_id = _store_agent(agent_spec, user_id)
         
-        # Clean response of markdown code blocks if present
-        if "```json" in text:
-            text = text.split("```json")[1].split("```")[0].strip()
-        elif "```" in text:
-            text = text.split("```")[1].split("```")[0].strip()
+        return {**agent_spec, "agent_id": agent_id}
         
-        # Parse JSON with error handling
-        try:
-            agent_spec = json.loads(text)
-            print("✅ Agent specification generated successfully with Claude 4!")
-        except json.JSONDecodeError as e:
-            print(f"❌ Failed to parse agent JSON: {str(e)}")
-            # Create a minimal fallback agent
-            agent_spec = {
-                "name": "Fallback Agent",
-                "description": "Generated due to JSON parsing error",
-                "nodes": [],
-                "edges": [],
-                "input_schema": {},
-                "output_schema": {},
-                "function": "def fallback_agent(input_data):\n    return {'error': 'Agent generation failed', 'input': input_data}",
-                "tools": [],
-                "integrations": [],
-                "mcp_clients": [],
-                "status": "error"
-            }
-        
-        # Store agent in database with user_id
-        agent_data = {
-            **agent_spec,
-            "created_at": datetime.utcnow(),
-            "status": "ready"
-        }
-        if user_id:
-            agent_data["user_id"] = user_id
-            
-        result = db.agents.insert_one(agent_data)
+    except Exception as e:
+        print(f"❌ Error in agent_developer_claude4: {str(e)}")
+        raise
+
+async def agent_developer_claude4_async(input_data: dict) -> dict:
+    """
+    Async variant of agent_developer_claude4 for running many agents concurrently.
+    The Claude call is awaited; JSON parsing and Mongo reads/writes run in a thread.
+    
+    Args:
+        input_data: Dictionary containing:
+            - requirements: Stringified agent node or additional requirements
+            - user_id: User ID for ownership tracking
+        
+    Returns:
+        Dictionary containing agent specification and agent_id
+    """
+
+    requirements = input_data.get("requirements", "")
+    user_id = input_data.get("user_id")
+    
+    try:
+        prompt = await asyncio.to_thread(_claude4_agent_prompt, requirements)
+        
+        print("🤖 Generating agent with Claude 4...")
         
-        return {**agent_spec, "agent_id": str(result.inserted_id)}
+        response = await async_claude_client.messages.create(
+            model="claude-sonnet-4-20250514",
+            max_tokens=8000,
+            system=CLAUDE4_SYSTEM_PROMPT,
+            messages=[{"role": "user", "content": prompt}]
+        )
+        
+        agent_spec = await asyncio.to_thread(_parse_claude4_agent_spec, response.content[0].text.strip())
+        agent_id = await asyncio.to_thread(_store_agent, agent_spec, user_id)
+        
+        return {**agent_spec, "agent_id": agent_id}
         
     except Exception as e:
-        print(f"❌ Error in agent_developer_claude4: {str(e)}")
+        print(f"❌ Error in agent_developer_claude4_async: {str(e)}")
         raise
@@ -16,17 +16,16 @@ from bson import ObjectId
 
 def load_agent_from_db(agent_id: str) -> Dict[str, Any]:
     """Load agent from MongoDB by agent_id."""
+    # Validate the ID before opening a connection
+    if not ObjectId.is_valid(agent_id):
+        print(f"Error: Invalid agent_id format: {agent_id}")
+        sys.exit(1)
+    
     try:
         client = MongoClient(os.getenv('MONGODB_URI'))
         db = client.vibeflows
         
-        # Convert string ID to ObjectId
-        try:
-            object_id = ObjectId(agent_id)
-        except:
-            print(f"Error: Invalid agent_id format: {agent_id}")
-            sys.exit(1)
-            
+        object_id = ObjectId(agent_id)
         agent_spec = db.agents.find_one({'_id': object_id})
         if not agent_spec:
             print(f"Error: Agent with ID '{agent_id}' not found in database")
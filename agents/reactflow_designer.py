@@ -133,6 +133,7 @@ def convert_design_to_react_flow(design_graph: Dict[str, Any]) -> Dict[str, Any]
     
     # Convert connections to React Flow edges
     react_flow_edges = []
+    node_type_by_id = {n["id"]: n.get("type") for n in nodes}
     for i, conn in enumerate(connections):
         edge_id = f"e{i+1}"
         
@@ -149,8 +150,7 @@ def convert_design_to_react_flow(design_graph: Dict[str, Any]) -> Dict[str, Any]
             edge["label"] = conn["label"]
         
         # Add sourceHandle for condition nodes if needed
-        source_node = next((n for n in nodes if n["id"] == conn["from"]), None)
-        if source_node and source_node.get("type") == "condition":
+        if node_type_by_id.get(conn["from"]) == "condition":
             edge["sourceHandle"] = conn["to"]  # Use target as handle identifier
         
         react_flow_edges.append(edge)
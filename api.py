@@ -1,25 +1,36 @@
 from fastapi import FastAPI, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect, Query, Header, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, Any, List, Union
 import json
+import orjson
 from datetime import datetime, timedelta
 from bson import ObjectId
 import asyncio
 import traceback
-from pymongo import MongoClient
 import os
 import uuid
+from mongo import get_db
 
-# Database connection
-client = MongoClient(os.getenv('MONGODB_URI'))
-db = client.vibeflows
+# Database connection (shared, explicitly pooled client)
+db = get_db()
+
+class MongoJSONResponse(ORJSONResponse):
+    """ORJSONResponse that also encodes MongoDB documents (ObjectId, datetimes)"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            default=str,
+            option=orjson.OPT_NON_STR_KEYS
+        )
 
 app = FastAPI(
     title="VibeFlows AI API",
     description="API for running VibeFlows AI workflow",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=MongoJSONResponse
 )
 
 app.add_middleware(
@@ -32,6 +43,20 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+
+# Pre-encoded SSE frame sent while the agent is busy, so idle proxies keep the connection open
+KEEPALIVE_EVENT = b"data: " + orjson.dumps({'type': 'keepalive'}) + b"\n\n"
+KEEPALIVE_INTERVAL = 15  # seconds
+
+# Response headers shared by every SSE stream
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Headers": "*"
+}
+
 class AIRequest(BaseModel):
     user_query: Optional[str] = ""
     chat_id: Optional[str] = None
@@ -51,76 +76,67 @@ async def process_ai_request_stream(request: AIRequest):
     chat_id = request.chat_id or str(uuid.uuid4())
     user_id = request.user_id or "anonymous"
     
-    # Create queue for real-time communication
-    stream_queue = asyncio.Queue()
-    
-    async def claude_background_task():
-        """Run Claude agent in background and feed queue"""
-        try:
-            from user_interface_claude4 import run_claude_agent_flow
-            
-            async for message in run_claude_agent_flow(user_query, chat_id, user_id):
-                await stream_queue.put(message)
-                
-        except Exception as e:
-            error_msg = f"data: {json.dumps({'type': 'error', 'message': f'❌ Claude agent error: {str(e)}', 'final': True})}\n\n"
-            await stream_queue.put(error_msg)
-        finally:
-            # Signal completion
-            await stream_queue.put(None)
-    
     async def generate_stream():
-        """Stream messages from queue in real-time"""
-        # Start Claude agent in background (non-blocking)
-        background_task = asyncio.create_task(claude_background_task())
+        """Pass agent messages straight through, sending keepalives while the agent is busy"""
+        from user_interface_claude4 import run_claude_agent_flow
+        
+        agent_stream = run_claude_agent_flow(user_query, chat_id, user_id).__aiter__()
+        pending = None
         
         try:
             while True:
-                # Get next message from queue (non-blocking)
-                try:
-                    message = await asyncio.wait_for(stream_queue.get(), timeout=1.0)
-                except asyncio.TimeoutError:
-                    # Send keepalive to prevent connection timeout
-                    yield f"data: {json.dumps({'type': 'keepalive'})}\n\n"
+                if pending is None:
+                    pending = asyncio.ensure_future(agent_stream.__anext__())
+                
+                # Race the next message against the keepalive interval without cancelling it
+                done, _ = await asyncio.wait({pending}, timeout=KEEPALIVE_INTERVAL)
+                if not done:
+                    yield KEEPALIVE_EVENT
                     continue
                 
-                # None signals completion
-                if message is None:
+                try:
+                    message = pending.result()
+                except StopAsyncIteration:
                     break
-                    
+                pending = None
+                
                 # Stream the message immediately
                 yield message
-                await asyncio.sleep(0.01)  # Small delay to prevent overwhelming
                 
         except asyncio.CancelledError:
             print("🔌 Client disconnected")
-            background_task.cancel()
+            raise
         except Exception as e:
-            yield f"data: {json.dumps({'type': 'error', 'message': f'Stream error: {str(e)}', 'final': True})}\n\n"
+            yield b"data: " + orjson.dumps({'type': 'error', 'message': f'❌ Claude agent error: {str(e)}', 'final': True}) + b"\n\n"
         finally:
-            # Cleanup background task
-            if not background_task.done():
-                background_task.cancel()
+            # Stop the agent if the client went away mid-message
+            if pending is not None and not pending.done():
+                pending.cancel()
                 try:
-                    await background_task
-                except asyncio.CancelledError:
+                    await pending
+                except (asyncio.CancelledError, Exception):
                     pass
+            await agent_stream.aclose()
     
     return StreamingResponse(
         generate_stream(),
-        media_type="text/plain",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "Content-Type": "text/event-stream",
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Headers": "*"
-        }
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
     )
 
 if __name__ == "__main__":
     import uvicorn
-    import os
     port = int(os.environ.get("PORT", 8000))
-    print(f"🚀 Starting server on port {port}")
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    workers = int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 2))
+    print(f"🚀 Starting server on port {port} with {workers} workers")
+    # Workers > 1 requires the app as an import string
+    uvicorn.run(
+        "api:app",
+        host="0.0.0.0",
+        port=port,
+        loop="uvloop",
+        http="httptools",
+        workers=workers,
+        proxy_headers=True,
+        access_log=False
+    )
\ No newline at end of file
@@ -3,17 +3,13 @@
 Debug script to understand why agent_ids are not being assigned to flow nodes
 """
 
-import os
-from pymongo import MongoClient
+import sys
+import argparse
 from bson import ObjectId
-from dotenv import load_dotenv
+from mongo import get_db, ensure_indexes
 
-# Load environment variables from .env file
-load_dotenv()
-
-# Connect to MongoDB
-client = MongoClient(os.getenv("MONGODB_URI"))
-db = client.vibeflows
+# Shared MongoDB connection (also loads .env)
+db = get_db()
 
 def debug_flow_node_structure():
     """Debug the flow node structure to understand the issue"""
@@ -21,8 +17,29 @@ def debug_flow_node_structure():
     print("🔍 Debugging flow node structure...")
     print("=" * 60)
     
-    # Get recent developed flows to compare
-    recent_flows = list(db.flows.find({"status": "developed"}).sort("created_at", -1).limit(5))
+    # Get recent developed flows with their node counts computed server-side
+    recent_flows = list(db.flows.aggregate([
+        {"$match": {"status": "developed"}},
+        {"$sort": {"created_at": -1}},
+        {"$limit": 5},
+        {"$addFields": {
+            "node_count": {"$size": {"$ifNull": ["$nodes", []]}},
+            "agent_nodes": {"$filter": {
+                "input": {"$ifNull": ["$nodes", []]},
+                "as": "n",
+                "cond": {"$eq": ["$$n.type", "agent"]}
+            }}
+        }},
+        {"$addFields": {
+            "agent_count": {"$size": "$agent_nodes"},
+            "with_id_count": {"$size": {"$filter": {
+                "input": "$agent_nodes",
+                "as": "n",
+                "cond": {"$ifNull": ["$$n.agent_id", False]}
+            }}}
+        }},
+        {"$project": {"agent_nodes": 0}}
+    ]))
     
     if not recent_flows:
         print("❌ No developed flows found")
@@ -35,27 +52,29 @@ def debug_flow_node_structure():
         flow_name = developed_flow.get("name", "Unnamed Flow")
         created_at = developed_flow.get("created_at", "unknown")
         
-        print(f"📋 Flow {i+1}: {flow_name}")
-        print(f"   ID: {flow_id}")
-        print(f"   Created: {created_at}")
-        print(f"   Status: {developed_flow.get('status')}")
-        print(f"   Agents Created Count: {developed_flow.get('agents_created_count', 0)}")
-        
-        # Analyze the nodes structure
-        nodes = developed_flow.get("nodes", [])
-        agent_nodes = [node for node in nodes if node.get("type") == "agent"]
-        nodes_with_agent_id = [node for node in agent_nodes if node.get("agent_id")]
+        # Node counts come precomputed from the pipeline
+        agent_count = developed_flow["agent_count"]
+        with_id_count = developed_flow["with_id_count"]
         
-        print(f"   Total nodes: {len(nodes)}")
-        print(f"   Agent nodes: {len(agent_nodes)}")
-        print(f"   Nodes with agent_id: {len(nodes_with_agent_id)}")
+        # Collect the report for this flow and write it in one go
+        out = [
+            f"📋 Flow {i+1}: {flow_name}",
+            f"   ID: {flow_id}",
+            f"   Created: {created_at}",
+            f"   Status: {developed_flow.get('status')}",
+            f"   Agents Created Count: {developed_flow.get('agents_created_count', 0)}",
+            f"   Total nodes: {developed_flow['node_count']}",
+            f"   Agent nodes: {agent_count}",
+            f"   Nodes with agent_id: {with_id_count}"
+        ]
         
-        if len(agent_nodes) > 0:
-            success_rate = (len(nodes_with_agent_id) / len(agent_nodes)) * 100
+        if agent_count > 0:
+            success_rate = (with_id_count / agent_count) * 100
             status = "✅" if success_rate == 100 else "❌"
-            print(f"   {status} Agent ID assignment rate: {success_rate:.1f}%")
+            out.append(f"   {status} Agent ID assignment rate: {success_rate:.1f}%")
         
-        print("-" * 40)
+        out.append("-" * 40)
+        sys.stdout.write("\n".join(out) + "\n")
     
     # Pick the first flow for detailed analysis
     developed_flow = recent_flows[0]
@@ -69,29 +88,34 @@ def debug_flow_node_structure():
     nodes = developed_flow.get("nodes", [])
     print(f"\n📊 Flow has {len(nodes)} total nodes")
     
+    out = []
     for i, node in enumerate(nodes):
-        print(f"\nNode {i+1}:")
-        print(f"   Type: {node.get('type', 'unknown')}")
-        print(f"   ID: {node.get('id', 'unknown')}")
-        print(f"   Name: {node.get('name', 'Unnamed')}")
+        out.append(f"\nNode {i+1}:")
+        out.append(f"   Type: {node.get('type', 'unknown')}")
+        out.append(f"   ID: {node.get('id', 'unknown')}")
+        out.append(f"   Name: {node.get('name', 'Unnamed')}")
         
         # Check all keys in the node
         all_keys = list(node.keys())
-        print(f"   All keys: {all_keys}")
+        out.append(f"   All keys: {all_keys}")
         
         if 'agent_id' in node:
-            print(f"   ✅ Has agent_id: {node['agent_id']}")
+            out.append(f"   ✅ Has agent_id: {node['agent_id']}")
         else:
-            print(f"   ❌ Missing agent_id")
+            out.append(f"   ❌ Missing agent_id")
         
         # If it's an agent node, print full structure
         if node.get('type') == 'agent':
-            print(f"   📝 Full agent node structure:")
+            out.append(f"   📝 Full agent node structure:")
             for key, value in node.items():
                 if isinstance(value, str) and len(value) > 100:
-                    print(f"      {key}: {value[:100]}...")
+                    out.append(f"      {key}: {value[:100]}...")
                 else:
-                    print(f"      {key}: {value}")
+                    out.append(f"      {key}: {value}")
+    
+    # Write the whole node dump with a single call
+    if out:
+        sys.stdout.write("\n".join(out) + "\n")
     
     print("\n" + "=" * 60)
     print("🤖 Checking recent agents that might belong to this flow...")
@@ -105,12 +129,10 @@ def debug_flow_node_structure():
         time_window_start = flow_created - timedelta(hours=1)
         time_window_end = flow_created + timedelta(hours=1)
         
-        related_agents = list(db.agents.find({
-            "created_at": {
-                "$gte": time_window_start,
-                "$lte": time_window_end
-            }
-        }).sort("created_at", -1))
+        related_agents = list(db.agents.find(
+            {"created_at": {"$gte": time_window_start, "$lt": time_window_end}},
+            {"_id": 1, "name": 1, "created_at": 1}
+        ).sort("created_at", -1))
         
         print(f"📊 Found {len(related_agents)} agents created around flow time")
         
@@ -171,6 +193,18 @@ def test_node_id_matching():
     
     print(f"\n📊 Total matches found: {matches_found}")
 
-if __name__ == "__main__":
+def main():
+    """Main function"""
+    
+    parser = argparse.ArgumentParser(description="Debug agent_id assignment on flow nodes")
+    parser.add_argument("--ensure-indexes", action="store_true", help="create the shared MongoDB indexes first")
+    args = parser.parse_args()
+    
+    if args.ensure_indexes:
+        ensure_indexes(db)
+    
     debug_flow_node_structure()
-    test_node_id_matching()
\ No newline at end of file
+    test_node_id_matching()
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -1,11 +1,237 @@
 import anthropic
+import ast
+import hashlib
 import json
+import operator
+import orjson
 import os
-from typing import Dict, Any
+import re
+import time
+from datetime import datetime
+from functools import lru_cache
+from types import SimpleNamespace
+from typing import Dict, Any, List
+from pymongo import UpdateOne
+from mongo import get_db
+
+db = get_db()
+
+# LLM verdicts are deterministic for a given (condition, output) pair, so they are cached
+CONDITION_CACHE_TTL = 24 * 60 * 60  # seconds
+# After a failed TTL index build the cache is skipped this long before retrying
+CONDITION_CACHE_RETRY_SECONDS = 60
+
+# Output data above this size is trimmed to the fields the conditions reference
+MAX_OUTPUT_PROMPT_BYTES = 4096
+_OUTPUT_FIELD_PATTERN = re.compile(r"\boutput\.([A-Za-z_][A-Za-z0-9_]*)")
+_condition_cache_ready = False
+_condition_cache_retry_at = 0.0
+
+CONDITION_SYSTEM_PROMPT = """
+You are a flow condition evaluator. 
+You determine if edge conditions are satisfied based on node output data.
+
+Evaluate each numbered condition against the provided output data.
+Return ONLY a JSON array of booleans, one per condition, in the given order.
+Example for three conditions: [true, false, false]
+
+Common condition patterns:
+- output.action_type === 'create_flow' 
+- output.action_type === 'run_flow'
+- output.action_type === 'respond'
+- output.needs_clarification === true
+- output.confidence > 0.8
+- Complex conditions with || (OR) and && (AND)
+
+Be precise and literal in your evaluation.
+"""
+
+@lru_cache(maxsize=1)
+def _get_client() -> anthropic.Anthropic:
+    """Anthropic client shared by all fallback calls, created on first use"""
+    return anthropic.Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY'))
+
+# JS-style tokens used in edge conditions and their Python equivalents.
+# String literals are matched first so their contents are left untouched.
+# `!` becomes `~` so it keeps JS unary precedence (`!a === b` is `(!a) === b`),
+# which Python's `not` would not. `undefined` stays a name and reads as _UNDEFINED.
+_JS_TOKEN_PATTERN = re.compile(
+    r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")"""
+    r"""|(===|!==|==|!=|&&|\|\||!|\btrue\b|\bfalse\b|\bnull\b)"""
+)
+_JS_TO_PYTHON = {
+    "===": "==",
+    "!==": "!=",
+    "==": "==",
+    "!=": "!=",
+    "&&": " and ",
+    "||": " or ",
+    "!": " ~",
+    "true": "True",
+    "false": "False",
+    "null": "None",
+}
+# JS loose equality coerces across types, so it is only decided locally for same-type operands
+_LOOSE_EQUALITY = {"==", "!="}
+
+# Only plain comparisons over `output` fields are evaluated locally
+_ALLOWED_NODES = (
+    ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Invert, ast.USub,
+    ast.Compare, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+    ast.Name, ast.Attribute, ast.Load, ast.Constant,
+)
+
+class _Undefined:
+    """JS `undefined`, kept apart from None (JSON null) so `=== null` and `=== undefined` differ"""
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return "undefined"
+
+_UNDEFINED = _Undefined()
+
+class _OutputNamespace(SimpleNamespace):
+    """Attribute view of node output; missing fields read as JS undefined"""
+
+    def __getattr__(self, name):
+        return _UNDEFINED
+
+class _NeedsLLM(Exception):
+    """The condition's JS semantics can't be reproduced locally for this output"""
+
+def _to_namespace(value):
+    """Recursively wrap dicts so `output.a.b` works as attribute access"""
+    if isinstance(value, dict):
+        return _OutputNamespace(**{str(k): _to_namespace(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return [_to_namespace(v) for v in value]
+    return value
+
+@lru_cache(maxsize=1024)
+def _compile_condition(condition: str):
+    """
+    Translate a JS-style condition to Python and parse it into a validated AST.
+    
+    Returns:
+        (expression node to walk, whether it uses JS loose equality), or None
+        if the condition uses anything outside the simple comparison grammar
+        and needs the LLM.
+    """
+    loose = False
+    
+    def translate(match):
+        nonlocal loose
+        if match.group(1):
+            return match.group(1)
+        loose = loose or match.group(2) in _LOOSE_EQUALITY
+        return _JS_TO_PYTHON[match.group(2)]
+    
+    translated = _JS_TOKEN_PATTERN.sub(translate, condition).strip()
+    
+    try:
+        tree = ast.parse(translated, mode="eval")
+    except SyntaxError:
+        return None
+    
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            return None
+        if isinstance(node, ast.Name) and node.id not in ("output", "undefined"):
+            return None
+        if isinstance(node, ast.Attribute) and node.attr.startswith("_"):
+            return None
+        if isinstance(node, ast.Compare) and len(node.ops) > 1:
+            return None  # JS `a < b < c` compares a boolean with c, not a range
+    
+    return tree.body, loose
+
+def _js_truthy(value):
+    """JS truthiness: objects and arrays are truthy even when empty"""
+    if isinstance(value, (list, _OutputNamespace)):
+        return True
+    if isinstance(value, float) and value != value:
+        return False  # NaN
+    return bool(value)
+
+def _js_kind(value):
+    """Type as JS sees it, so bools and numbers never compare equal"""
+    if value is None:
+        return "null"
+    if value is _UNDEFINED:
+        return "undefined"
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, (int, float)):
+        return "number"
+    if isinstance(value, str):
+        return "string"
+    raise _NeedsLLM("object or array comparison")  # JS compares these by identity
+
+def _js_equal(left, right, loose):
+    if _js_kind(left) != _js_kind(right):
+        if loose and {_js_kind(left), _js_kind(right)} == {"null", "undefined"}:
+            return True  # null == undefined
+        if loose:
+            raise _NeedsLLM("loose equality across types")
+        return False
+    return left == right
+
+_ORDER_OPS = {
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+
+def _eval_node(node, output, loose):
+    """Walk a validated condition AST with JS semantics; raises when it can't decide"""
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.Name):
+        return output if node.id == "output" else _UNDEFINED
+    if isinstance(node, ast.Attribute):
+        value = _eval_node(node.value, output, loose)
+        if isinstance(value, _OutputNamespace):
+            return getattr(value, node.attr)
+        if node.attr == "length" and isinstance(value, (str, list)):
+            return len(value)
+        raise _NeedsLLM(f"property '{node.attr}' of {type(value).__name__}")
+    if isinstance(node, ast.BoolOp):
+        # Short-circuits and returns the deciding operand, like JS && and ||
+        value = None
+        for operand in node.values:
+            value = _eval_node(operand, output, loose)
+            if isinstance(node.op, ast.And) != _js_truthy(value):
+                return value
+        return value
+    if isinstance(node, ast.UnaryOp):
+        value = _eval_node(node.operand, output, loose)
+        if isinstance(node.op, ast.Invert):
+            return not _js_truthy(value)
+        if _js_kind(value) != "number":
+            raise _NeedsLLM("negating a non-number")
+        return -value
+    if isinstance(node, ast.Compare):
+        left = _eval_node(node.left, output, loose)
+        op = node.ops[0]
+        right = _eval_node(node.comparators[0], output, loose)
+        if isinstance(op, ast.Eq):
+            return _js_equal(left, right, loose)
+        if isinstance(op, ast.NotEq):
+            return not _js_equal(left, right, loose)
+        if _js_kind(left) != _js_kind(right) or _js_kind(left) not in ("number", "string"):
+            raise _NeedsLLM("ordering comparison that JS would coerce")
+        return _ORDER_OPS[type(op)](left, right)
+    raise _NeedsLLM(f"unsupported condition node: {type(node).__name__}")
 
 def check_edge_condition(condition: str, output_data: Dict[str, Any]) -> bool:
     """
-    Check if edge condition is met using LLM evaluation ONLY.
+    Check if edge condition is met.
+    
+    Simple comparisons (output.x === 'y', numeric checks, &&, ||, !) are
+    evaluated locally; anything else falls back to LLM evaluation.
     
     Args:
         condition: The condition string from the edge definition
@@ -18,60 +244,134 @@ def check_edge_condition(condition: str, output_data: Dict[str, Any]) -> bool:
     if not condition or condition.strip() == "":
         return True  # Empty condition always passes
     
-    SYSTEM = """
-You are a flow condition evaluator. 
-You determine if edge conditions are satisfied based on node output data.
+    verdict = _evaluate_locally(condition, output_data)
+    if verdict is None:
+        return _llm_check_edge_conditions([condition], output_data)[0]
+    return verdict
 
-Evaluate the given condition against the provided output data.
-Return ONLY true or false (boolean).
+def _evaluate_locally(condition: str, output_data: Dict[str, Any]):
+    """Evaluate a condition in-process; returns None if it needs the LLM"""
+    compiled = _compile_condition(condition)
+    if compiled is None:
+        return None
+    expression, loose = compiled
+    
+    try:
+        return _js_truthy(_eval_node(expression, _to_namespace(output_data), loose))
+    except Exception as e:
+        # Anything the local evaluator can't decide with JS semantics goes to the LLM
+        print(f"Warning: Could not evaluate condition '{condition}' locally, using LLM: {e}")
+        return None
 
-Common condition patterns:
-- output.action_type === 'create_flow' 
-- output.action_type === 'run_flow'
-- output.action_type === 'respond'
-- output.needs_clarification === true
-- output.confidence > 0.8
-- Complex conditions with || (OR) and && (AND)
+def _ensure_condition_cache():
+    """Create the TTL index for cached verdicts once per process, retrying after a failure"""
+    global _condition_cache_ready, _condition_cache_retry_at
+    if not _condition_cache_ready and time.monotonic() >= _condition_cache_retry_at:
+        try:
+            db.edge_condition_cache.create_index("created_at", expireAfterSeconds=CONDITION_CACHE_TTL)
+            _condition_cache_ready = True
+        except Exception as e:
+            print(f"Warning: Could not create edge condition cache index: {e}")
+            _condition_cache_retry_at = time.monotonic() + CONDITION_CACHE_RETRY_SECONDS
+    return _condition_cache_ready
 
-Be precise and literal in your evaluation.
-"""
+def _condition_cache_key(condition: str, output_data: Dict[str, Any]) -> str:
+    payload = orjson.dumps(output_data, default=str, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    return hashlib.sha256(condition.encode() + b"\x00" + payload).hexdigest()
 
+def _output_for_prompt(conditions: List[str], output_data: Dict[str, Any]) -> str:
+    """Compact JSON of the output; large outputs keep only the fields the conditions use"""
+    payload = orjson.dumps(output_data, default=str, option=orjson.OPT_NON_STR_KEYS)
+    if len(payload) > MAX_OUTPUT_PROMPT_BYTES and isinstance(output_data, dict):
+        fields = {name for c in conditions for name in _OUTPUT_FIELD_PATTERN.findall(c)}
+        if fields:
+            trimmed = {k: v for k, v in output_data.items() if k in fields}
+            payload = orjson.dumps(trimmed, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return payload.decode()
+
+def _llm_check_edge_conditions(conditions: List[str], output_data: Dict[str, Any]) -> List[bool]:
+    """
+    Evaluate conditions the local evaluator cannot handle using the LLM.
+    
+    Cached verdicts are read in one query and all misses go to the model
+    in a single request.
+    """
+    
+    verdicts = {}
+    cache_keys = {}
+    if _ensure_condition_cache():
+        try:
+            cache_keys = {c: _condition_cache_key(c, output_data) for c in conditions}
+            cached = db.edge_condition_cache.find(
+                {"_id": {"$in": list(cache_keys.values())}}, {"verdict": 1}
+            )
+            by_key = {doc["_id"]: doc["verdict"] for doc in cached}
+            verdicts = {c: by_key[k] for c, k in cache_keys.items() if k in by_key}
+        except Exception as e:
+            print(f"Warning: Edge condition cache read failed: {e}")
+            cache_keys = {}
+    
+    misses = [c for c in dict.fromkeys(conditions) if c not in verdicts]
+    if misses:
+        answers = _ask_llm(misses, output_data)
+        writes = []
+        for condition, verdict in zip(misses, answers):
+            if verdict is None:
+                continue  # Unparseable or failed; defaults to false below and is not cached
+            verdicts[condition] = verdict
+            if condition in cache_keys:
+                writes.append(UpdateOne(
+                    {"_id": cache_keys[condition]},
+                    {"$setOnInsert": {"condition": condition, "verdict": verdict, "created_at": datetime.utcnow()}},
+                    upsert=True
+                ))
+        if writes:
+            try:
+                db.edge_condition_cache.bulk_write(writes, ordered=False)
+            except Exception as e:
+                print(f"Warning: Edge condition cache write failed: {e}")
+    
+    return [verdicts.get(c, False) for c in conditions]
+
+def _ask_llm(conditions: List[str], output_data: Dict[str, Any]) -> list:
+    """Ask the model for one verdict per condition; None where it cannot be obtained"""
     try:
-        client = anthropic.Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY'))
-        
+        numbered = "\n".join(f"{i + 1}. {c}" for i, c in enumerate(conditions))
         messages = [
-            {"role": "user", "content": f"Condition: {condition}\n\nOutput Data: {json.dumps(output_data, indent=2)}\n\nEvaluate if the condition is met. Return only true or false."}
+            {"role": "user", "content": f"Conditions:\n{numbered}\n\nOutput Data: {_output_for_prompt(conditions, output_data)}\n\nEvaluate if each condition is met. Return only the JSON array."}
         ]
         
-        response = client.messages.create(
+        response = _get_client().messages.create(
             model="claude-sonnet-4-20250514",
-            max_tokens=100,
-            system=SYSTEM,
+            max_tokens=max(100, 20 * len(conditions)),
+            system=CONDITION_SYSTEM_PROMPT,
             messages=messages
         )
         
         result_text = response.content[0].text.strip().lower()
         
-        # Parse boolean response
-        if result_text == "true":
-            return True
-        elif result_text == "false":
-            return False
-        else:
-            # Try to parse as JSON boolean
-            try:
-                return json.loads(result_text)
-            except:
-                print(f"Warning: Could not parse LLM condition result: {result_text}")
-                return False  # Default to false if unparseable
+        # Parse the boolean array
+        try:
+            results = json.loads(result_text)
+        except ValueError:
+            results = None
+        if (isinstance(results, list) and len(results) == len(conditions)
+                and all(isinstance(r, bool) for r in results)):
+            return results
+        
+        print(f"Warning: Could not parse LLM condition result: {result_text}")
+        return [None] * len(conditions)
                 
     except Exception as e:
         print(f"Error in LLM condition evaluation: {e}")
-        return False  # Default to false on error
+        return [None] * len(conditions)
 
 def get_next_node_by_conditions(edges: list, current_node_id: str, output_data: Dict[str, Any]) -> str:
     """
-    Determine the next node based on edge conditions using LLM evaluation.
+    Determine the next node based on edge conditions.
+    
+    Edges are checked in order. Conditions that need the LLM are evaluated
+    together in one request, and only if no earlier edge already matched.
     
     Args:
         edges: List of edge definitions from the flow
@@ -84,11 +384,35 @@ def get_next_node_by_conditions(edges: list, current_node_id: str, output_data:
     
     valid_edges = [edge for edge in edges if edge.get("source") == current_node_id]
     
+    verdicts = []
+    llm_pending = []
     for edge in valid_edges:
         condition = edge.get("condition", "")
         
-        if check_edge_condition(condition, output_data):
+        if not condition or condition.strip() == "":
+            verdict = True
+        else:
+            verdict = _evaluate_locally(condition, output_data)
+        
+        if verdict is True and not llm_pending:
+            return edge.get("target")  # No earlier edge is waiting on the LLM
+        
+        verdicts.append(verdict)
+        if verdict is True:
+            break  # Later edges cannot win
+        if verdict is None:
+            llm_pending.append(len(verdicts) - 1)
+    
+    if llm_pending:
+        llm_verdicts = _llm_check_edge_conditions(
+            [valid_edges[i]["condition"] for i in llm_pending], output_data
+        )
+        for i, verdict in zip(llm_pending, llm_verdicts):
+            verdicts[i] = verdict
+    
+    for edge, verdict in zip(valid_edges, verdicts):
+        if verdict:
             return edge.get("target")
     
     # If no conditions match, return None
-    return None 
\ No newline at end of file
+    return None
@@ -3,16 +3,23 @@
 Find actual user_ids and their flows in the database
 """
 
-import os
-from pymongo import MongoClient
-from dotenv import load_dotenv
+import argparse
+from mongo import get_db, ensure_indexes
 
-# Load environment variables from .env file
-load_dotenv()
+# Shared MongoDB connection (also loads .env)
+db = get_db()
 
-# Connect to MongoDB
-client = MongoClient(os.getenv("MONGODB_URI"))
-db = client.vibeflows
+# Agent-node counts computed server-side, so `nodes` never leaves the database
+AGENT_NODE_STATS = {
+    "agent_nodes": {"$size": {"$filter": {
+        "input": {"$ifNull": ["$nodes", []]},
+        "cond": {"$eq": ["$$this.type", "agent"]}
+    }}},
+    "agent_nodes_with_id": {"$size": {"$filter": {
+        "input": {"$ifNull": ["$nodes", []]},
+        "cond": {"$and": [{"$eq": ["$$this.type", "agent"]}, {"$ifNull": ["$$this.agent_id", False]}]}
+    }}}
+}
 
 def find_user_flows():
     """Find all user_ids and their flows"""
@@ -20,41 +27,43 @@ def find_user_flows():
     print("🔍 Finding user_ids and their flows...")
     print("=" * 60)
     
-    # Get all unique user_ids from flows
-    user_ids = db.flows.distinct("user_id")
-    print(f"📊 Found {len(user_ids)} unique user_ids in flows:")
+    # Flow count and latest flow per user in one pipeline; the $project before
+    # $group keeps only the summary fields so whole flows are never grouped
+    user_stats = list(db.flows.aggregate([
+        {"$match": {"user_id": {"$nin": [None, ""]}}},
+        {"$sort": {"created_at": -1}},
+        {"$project": {"user_id": 1, "name": 1, "created_at": 1, "status": 1, **AGENT_NODE_STATS}},
+        {"$group": {
+            "_id": "$user_id",
+            "flow_count": {"$sum": 1},
+            "latest": {"$first": "$$ROOT"}
+        }},
+        {"$sort": {"_id": 1}}
+    ]))
+    print(f"📊 Found {len(user_stats)} unique user_ids in flows:")
     
-    for i, user_id in enumerate(user_ids):
-        if user_id:  # Skip None/null user_ids
-            # Count flows for this user
-            flow_count = db.flows.count_documents({"user_id": user_id})
-            
-            # Get latest flow for this user
-            latest_flow = db.flows.find_one(
-                {"user_id": user_id}, 
-                sort=[("created_at", -1)]
-            )
-            
-            if latest_flow:
-                flow_name = latest_flow.get("name", "Unnamed")
-                created_at = latest_flow.get("created_at", "unknown")
-                status = latest_flow.get("status", "unknown")
-                
-                print(f"\n👤 User {i+1}: {user_id}")
-                print(f"   Total flows: {flow_count}")
-                print(f"   Latest flow: {flow_name}")
-                print(f"   Created: {created_at}")
-                print(f"   Status: {status}")
-                
-                # Check agent nodes in latest flow
-                nodes = latest_flow.get("nodes", [])
-                agent_nodes = [node for node in nodes if node.get("type") == "agent"]
-                nodes_with_agent_id = [node for node in agent_nodes if node.get("agent_id")]
-                
-                if len(agent_nodes) > 0:
-                    success_rate = (len(nodes_with_agent_id) / len(agent_nodes)) * 100
-                    status = "✅" if success_rate == 100 else "❌"
-                    print(f"   {status} Agent nodes: {len(nodes_with_agent_id)}/{len(agent_nodes)} have agent_ids ({success_rate:.1f}%)")
+    for i, stats in enumerate(user_stats):
+        user_id = stats["_id"]
+        latest_flow = stats["latest"]
+        
+        flow_name = latest_flow.get("name", "Unnamed")
+        created_at = latest_flow.get("created_at", "unknown")
+        status = latest_flow.get("status", "unknown")
+        
+        print(f"\n👤 User {i+1}: {user_id}")
+        print(f"   Total flows: {stats['flow_count']}")
+        print(f"   Latest flow: {flow_name}")
+        print(f"   Created: {created_at}")
+        print(f"   Status: {status}")
+        
+        # Check agent nodes in latest flow
+        agent_nodes = latest_flow["agent_nodes"]
+        nodes_with_agent_id = latest_flow["agent_nodes_with_id"]
+        
+        if agent_nodes > 0:
+            success_rate = (nodes_with_agent_id / agent_nodes) * 100
+            status = "✅" if success_rate == 100 else "❌"
+            print(f"   {status} Agent nodes: {nodes_with_agent_id}/{agent_nodes} have agent_ids ({success_rate:.1f}%)")
     
     # Also show flows without user_id
     flows_without_user = db.flows.count_documents({"user_id": {"$in": [None, ""]}})
@@ -72,13 +81,11 @@ def find_user_flows():
             print(f"   Latest: {flow_name} ({created_at})")
     
     print(f"\n📋 All flows (most recent first):")
-    all_flows = list(db.flows.find({}, {
-        "_id": 1, 
-        "name": 1, 
-        "user_id": 1, 
-        "created_at": 1, 
-        "status": 1
-    }).sort("created_at", -1).limit(10))
+    all_flows = list(db.flows.aggregate([
+        {"$sort": {"created_at": -1}},
+        {"$limit": 10},
+        {"$project": {"name": 1, "user_id": 1, "created_at": 1, "status": 1, **AGENT_NODE_STATS}}
+    ]))
     
     for i, flow in enumerate(all_flows):
         flow_id = str(flow["_id"])
@@ -92,7 +99,20 @@ def find_user_flows():
         print(f"       User: {user_id}")
         print(f"       Created: {created_at}")
         print(f"       Status: {status}")
+        print(f"       Agent nodes: {flow['agent_nodes_with_id']}/{flow['agent_nodes']} have agent_ids")
         print()
 
+def main():
+    """Main function"""
+    
+    parser = argparse.ArgumentParser(description="Find user_ids and their flows")
+    parser.add_argument("--ensure-indexes", action="store_true", help="create the shared MongoDB indexes first")
+    args = parser.parse_args()
+    
+    if args.ensure_indexes:
+        ensure_indexes(db)
+    
+    find_user_flows()
+
 if __name__ == "__main__":
-    find_user_flows()
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -3,31 +3,38 @@
 Script to fix agent_id assignment issue in flow developer
 """
 
-import os
-from pymongo import MongoClient
+import argparse
+from pymongo import UpdateOne
 from bson import ObjectId
-from dotenv import load_dotenv
+from rapidfuzz import fuzz, process
+from mongo import get_db, ensure_indexes
 
-# Load environment variables from .env file
-load_dotenv()
+# Shared MongoDB connection (also loads .env)
+db = get_db()
 
-# Connect to MongoDB
-client = MongoClient(os.getenv("MONGODB_URI"))
-db = client.vibeflows
+# Minimum token_set_ratio (0-100) for a node/agent name pair to count as a match
+MATCH_SCORE_THRESHOLD = 60
+
+BULK_BATCH_SIZE = 500
 
 def analyze_broken_flows():
-    """Analyze flows that are marked as developed but missing agent_ids"""
+    """
+    Analyze flows that are marked as developed but missing agent_ids.
+    Yields (flow, matched_pairs) for every flow whose agent nodes can all be matched.
+    """
     
     print("🔍 Analyzing broken flows...")
     print("=" * 60)
     
-    # Get flows that are marked as developed but have no agent_ids
-    broken_flows = list(db.flows.find({
+    # Get developed flows where some agent node has no agent_id; checks the nodes
+    # themselves rather than trusting a possibly stale agents_created_count
+    broken_flows = db.flows.find({
         "status": "developed",
-        "agents_created_count": 0
-    }).sort("created_at", -1))
-    
-    print(f"Found {len(broken_flows)} broken flows")
+        "nodes": {"$elemMatch": {
+            "type": "agent",
+            "$or": [{"agent_id": {"$exists": False}}, {"agent_id": None}]
+        }}
+    }, {"name": 1, "created_at": 1, "nodes": 1}).sort("created_at", -1)
     
     for flow in broken_flows:
         flow_id = str(flow["_id"])
@@ -51,135 +58,128 @@ def analyze_broken_flows():
             time_start = created_at - timedelta(minutes=30)
             time_end = created_at + timedelta(minutes=30)
             
-            related_agents = list(db.agents.find({
-                "created_at": {
-                    "$gte": time_start,
-                    "$lte": time_end
-                }
-            }).sort("created_at", 1))
+            # Single range predicate on created_at (indexed with --ensure-indexes); only the fields used for matching
+            related_agents = list(db.agents.find(
+                {"created_at": {"$gte": time_start, "$lt": time_end}},
+                {"_id": 1, "name": 1}
+            ).sort("created_at", 1))
             
             print(f"   Related agents found: {len(related_agents)}")
             
-            # Try to match agents to nodes by name similarity
+            # Score every node name against every agent name in one vectorized call
             matched_pairs = []
-            for node in agent_nodes:
-                node_name = node.get("name", "").lower()
-                node_id = node.get("id", "")
-                
-                # Find best matching agent
+            scores = None
+            if agent_nodes and related_agents:
+                node_names = [node.get("name", "").lower().replace("_", " ") for node in agent_nodes]
+                agent_names = [agent.get("name", "").lower().replace("_", " ") for agent in related_agents]
+                scores = process.cdist(node_names, agent_names, scorer=fuzz.token_set_ratio, workers=-1)
+            
+            for row, node in enumerate(agent_nodes):
                 best_match = None
                 best_score = 0
+                if scores is not None:
+                    best_index = int(scores[row].argmax())
+                    best_score = float(scores[row, best_index])
+                    best_match = related_agents[best_index]
                 
-                for agent in related_agents:
-                    agent_name = agent.get("name", "").lower()
-                    agent_id = str(agent["_id"])
-                    
-                    # Simple scoring based on name similarity
-                    score = 0
-                    if node_name in agent_name or agent_name in node_name:
-                        score += 50
-                    if node_id.replace("_", " ") in agent_name:
-                        score += 30
-                    
-                    # Check for keyword matches
-                    node_words = set(node_name.replace("_", " ").split())
-                    agent_words = set(agent_name.replace("_", " ").split())
-                    common_words = node_words.intersection(agent_words)
-                    score += len(common_words) * 10
-                    
-                    if score > best_score:
-                        best_score = score
-                        best_match = agent
-                
-                if best_match and best_score > 20:  # Threshold for good match
+                if best_match and best_score >= MATCH_SCORE_THRESHOLD:
                     matched_pairs.append({
                         "node": node,
                         "agent": best_match,
                         "score": best_score
                     })
-                    print(f"     ✅ {node.get('name')} -> {best_match.get('name')} (score: {best_score})")
+                    print(f"     ✅ {node.get('name')} -> {best_match.get('name')} (score: {best_score:.0f})")
                 else:
                     print(f"     ❌ No match for {node.get('name')}")
             
-            # Ask if we should fix this flow
+            # Only flows where every agent node found a match are fixed automatically
             if matched_pairs and len(matched_pairs) == len(agent_nodes):
                 print(f"\n   🔧 Can auto-fix this flow with {len(matched_pairs)} matches")
-                return flow, matched_pairs
-    
-    return None, None
+                yield flow, matched_pairs
 
 def fix_flow_agent_assignments(flow, matched_pairs):
-    """Fix agent_id assignments for a flow"""
+    """
+    Build the update that assigns matched agent_ids to a flow's nodes.
+    It only fills nodes that had no agent_id when the flow was read, and only applies
+    if all of them still have none, so a concurrent writer is never clobbered;
+    re-running the script is safe.
+    """
     
-    flow_id = flow["_id"]
     flow_name = flow.get("name", "Unnamed")
     
     print(f"\n🔧 Fixing flow: {flow_name}")
     print("=" * 60)
     
-    # Update the flow nodes with agent_ids
-    updated_nodes = []
-    
-    for node in flow.get("nodes", []):
-        updated_node = node.copy()
-        
-        # Find matching agent for this node
-        for match in matched_pairs:
-            if match["node"]["id"] == node["id"]:
-                agent_id = str(match["agent"]["_id"])
-                updated_node["agent_id"] = agent_id
-                print(f"✅ {node.get('name')} -> {agent_id}")
-                break
-        
-        updated_nodes.append(updated_node)
-    
-    # Update the flow in database
-    update_data = {
-        "$set": {
-            "nodes": updated_nodes,
-            "agents_created_count": len(matched_pairs)
-        }
-    }
-    
-    result = db.flows.update_one({"_id": flow_id}, update_data)
+    # One targeted $set per node, each guarded on the node's agent_id still being empty
+    unassigned = {"$in": [None, ""]}
+    node_guards = []
+    array_filters = []
+    update = {"agents_created_count": len(matched_pairs)}
+    for i, match in enumerate(matched_pairs):
+        node = match["node"]
+        if node.get("agent_id"):
+            continue
+        agent_id = str(match["agent"]["_id"])
+        update[f"nodes.$[n{i}].agent_id"] = agent_id
+        array_filters.append({f"n{i}.id": node["id"], f"n{i}.agent_id": unassigned})
+        node_guards.append({"$elemMatch": {"id": node["id"], "agent_id": unassigned}})
+        print(f"✅ {node.get('name')} -> {agent_id}")
     
-    if result.modified_count > 0:
-        print(f"✅ Successfully fixed flow {flow_name}")
-        return True
-    else:
-        print(f"❌ Failed to update flow {flow_name}")
-        return False
+    return UpdateOne(
+        {"_id": flow["_id"], "nodes": {"$all": node_guards}},
+        {"$set": update},
+        array_filters=array_filters
+    )
+
+def apply_fixes(updates):
+    """Write fixes in unordered bulk batches; returns (matched, modified) counts"""
+    matched = modified = 0
+    for start in range(0, len(updates), BULK_BATCH_SIZE):
+        result = db.flows.bulk_write(updates[start:start + BULK_BATCH_SIZE], ordered=False)
+        matched += result.matched_count
+        modified += result.modified_count
+    return matched, modified
 
 def main():
     """Main function"""
     
+    parser = argparse.ArgumentParser(description="Assign missing agent_ids to developed flows")
+    parser.add_argument("--yes", action="store_true", help="apply fixes without asking for confirmation")
+    parser.add_argument("--dry-run", action="store_true", help="only report fixable flows")
+    parser.add_argument("--ensure-indexes", action="store_true", help="create the shared MongoDB indexes first")
+    args = parser.parse_args()
+    
+    if args.ensure_indexes:
+        ensure_indexes(db)
+    
     print("🚀 Agent ID Assignment Fixer")
     print("=" * 60)
     
-    # Analyze broken flows
-    flow, matched_pairs = analyze_broken_flows()
+    # Analyze broken flows and build all fixes in one pass
+    updates = [
+        fix_flow_agent_assignments(flow, matched_pairs)
+        for flow, matched_pairs in analyze_broken_flows()
+    ]
     
-    if flow and matched_pairs:
-        print(f"\n🤔 Found fixable flow: {flow.get('name')}")
-        response = input("Do you want to fix this flow? (y/N): ").strip().lower()
-        
-        if response == 'y':
-            success = fix_flow_agent_assignments(flow, matched_pairs)
-            if success:
-                print("\n🎉 Flow fixed successfully!")
-                
-                # Verify the fix
-                fixed_flow = db.flows.find_one({"_id": flow["_id"]})
-                agent_nodes = [node for node in fixed_flow.get("nodes", []) if node.get("type") == "agent"]
-                nodes_with_agent_id = [node for node in agent_nodes if node.get("agent_id")]
-                
-                print(f"✅ Verification: {len(nodes_with_agent_id)}/{len(agent_nodes)} nodes now have agent_ids")
-            else:
-                print("\n❌ Failed to fix flow")
-        else:
-            print("\n⏭️ Skipping fix")
-    else:
+    if not updates:
         print("\n📭 No fixable flows found")
+        return
+    
+    print(f"\n🤔 Found {len(updates)} fixable flow(s)")
+    if args.dry_run:
+        print("\n⏭️ Dry run, no changes written")
+        return
+    
+    if not args.yes:
+        response = input(f"Do you want to fix {len(updates)} flow(s)? (y/N): ").strip().lower()
+        if response != 'y':
+            print("\n⏭️ Skipping fix")
+            return
+    
+    matched, modified = apply_fixes(updates)
+    print(f"\n🎉 Fixed {modified}/{len(updates)} flow(s)")
+    if matched < len(updates):
+        print(f"⚠️ {len(updates) - matched} flow(s) changed since analysis and were skipped; re-run to retry them")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -3,17 +3,22 @@
 Fix agents_created_count to match actual agent_ids in flows
 """
 
-import os
-from pymongo import MongoClient
+from pymongo import UpdateOne
 from bson import ObjectId
-from dotenv import load_dotenv
+from mongo import get_db
 
-# Load environment variables
-load_dotenv()
+# Shared MongoDB connection (also loads .env)
+db = get_db()
 
-# Connect to MongoDB
-client = MongoClient(os.getenv("MONGODB_URI"))
-db = client.vibeflows
+BULK_BATCH_SIZE = 500
+
+def flush_updates(updates):
+    """Apply queued count fixes in one unordered bulk write; returns flows modified"""
+    if not updates:
+        return 0
+    result = db.flows.bulk_write(updates, ordered=False)
+    updates.clear()
+    return result.modified_count
 
 def fix_agents_count():
     """Fix agents_created_count for all flows"""
@@ -21,12 +26,21 @@ def fix_agents_count():
     print("🔧 Fixing agents_created_count for all flows...")
     print("=" * 60)
     
-    # Get all flows
-    flows = list(db.flows.find({}))
+    # Stream all flows with only the fields needed to recount agents
+    flows = db.flows.find({}, {
+        "_id": 1,
+        "name": 1,
+        "agents_created_count": 1,
+        "nodes.type": 1,
+        "nodes.agent_id": 1
+    }).batch_size(BULK_BATCH_SIZE)
     
+    checked_count = 0
     fixed_count = 0
+    pending_updates = []
     
     for flow in flows:
+        checked_count += 1
         flow_id = str(flow["_id"])
         flow_name = flow.get("name", "Unnamed")
         current_count = flow.get("agents_created_count", 0)
@@ -41,23 +55,22 @@ def fix_agents_count():
             print(f"📋 {flow_name}")
             print(f"   Current count: {current_count}")
             print(f"   Actual count: {actual_count}")
+            print(f"   🔧 Fixing: {current_count} -> {actual_count}")
             
-            # Update the flow
-            result = db.flows.update_one(
+            # Queue the update; written in batches below
+            pending_updates.append(UpdateOne(
                 {"_id": flow["_id"]},
                 {"$set": {"agents_created_count": actual_count}}
-            )
-            
-            if result.modified_count > 0:
-                print(f"   ✅ Fixed: {current_count} -> {actual_count}")
-                fixed_count += 1
-            else:
-                print(f"   ❌ Failed to update")
+            ))
+            if len(pending_updates) >= BULK_BATCH_SIZE:
+                fixed_count += flush_updates(pending_updates)
         elif actual_count > 0:
             print(f"✅ {flow_name}: {actual_count} agents (already correct)")
     
+    fixed_count += flush_updates(pending_updates)
+    
     print(f"\n📊 Summary:")
-    print(f"   Total flows checked: {len(flows)}")
+    print(f"   Total flows checked: {checked_count}")
     print(f"   Flows fixed: {fixed_count}")
 
 if __name__ == "__main__":
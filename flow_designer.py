@@ -8,68 +8,94 @@ from datetime import datetime
 client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
 db = MongoClient(os.getenv("MONGODB_URI")).vibeflows
 
-def flow_designer(input_data: dict) -> dict:
-    requirements = input_data.get('requirements', '')
-    user_id = input_data.get('user_id')
-    
-    system_prompt = """You are a workflow architect. Design flows that break down user requirements into executable nodes.
-
-Return ONLY valid JSON with proper flow structure. No markdown, no explanations."""
-
-    prompt = f"""Create a flow for these requirements: {requirements}
+FLOW_SYSTEM_PROMPT = """You are a workflow architect. Design flows that break down user requirements into executable nodes.
 
 Design a flow that breaks down the user query into agents.
 
 Each agent is responsible for doing a task (consisted of 2-4 related functions) 
 that is taking care of a specific part of the user query.
 
-Return ONLY valid JSON with this structure:
-{{
-   "name": "flow_name",
-   "description": "what this flow accomplishes",
-   "input_schema": {{"type": "object", "properties": {{}}}},
-   "output_schema": {{"type": "object", "properties": {{}}}},
-   "nodes": [
-       {{
-           "id": "node_id", 
-           "type": "agent",
-           "name": "node_name",
-           "description": "specific node description",
-           "input_schema": {{"type": "object", "properties": {{}}}},
-           "output_schema": {{"type": "object", "properties": {{}}}},
-       }}
-   ],
-   "edges": [
-       {{
-           "id": "edge_1",
-           "source": "node1", 
-           "target": "node2", 
-           "sourceHandle": "output",
-           "targetHandle": "input",
-           "label": "success path",
-           "condition": "result.status == 'success'"
-       }}
-   ]
-}}"""
+Edges connect nodes in execution order. An edge condition is a JS-style expression
+over the source node's output, e.g. output.status === 'success'; leave it empty
+for an unconditional edge.
+
+Always answer by calling the save_flow tool with the complete flow."""
+
+# Tool input schema for a flow; forcing this tool makes the API return the flow as parsed JSON
+FLOW_SPEC_TOOL = {
+    "name": "save_flow",
+    "description": "Save the designed flow.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "name": {"type": "string", "description": "flow_name"},
+            "description": {"type": "string", "description": "what this flow accomplishes"},
+            "input_schema": {"type": "object"},
+            "output_schema": {"type": "object"},
+            "nodes": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "id": {"type": "string"},
+                        "type": {"type": "string", "enum": ["agent"]},
+                        "name": {"type": "string"},
+                        "description": {"type": "string", "description": "specific node description"},
+                        "input_schema": {"type": "object"},
+                        "output_schema": {"type": "object"}
+                    },
+                    "required": ["id", "type", "name", "description", "input_schema", "output_schema"]
+                }
+            },
+            "edges": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "id": {"type": "string"},
+                        "source": {"type": "string"},
+                        "target": {"type": "string"},
+                        "sourceHandle": {"type": "string", "description": "e.g. output"},
+                        "targetHandle": {"type": "string", "description": "e.g. input"},
+                        "label": {"type": "string", "description": "e.g. success path"},
+                        "condition": {"type": "string"}
+                    },
+                    "required": ["id", "source", "target"]
+                }
+            }
+        },
+        "required": ["name", "description", "input_schema", "output_schema", "nodes", "edges"]
+    }
+}
+
+FLOW_MAX_TOKENS = 4000
+
+def flow_designer(input_data: dict) -> dict:
+    requirements = input_data.get('requirements', '')
+    user_id = input_data.get('user_id')
+    
+    prompt = f"Create a flow for these requirements: {requirements}"
    
     try:
         response = client.messages.create(
             model="claude-sonnet-4-20250514",
-            max_tokens=4000,
-            system=system_prompt,
+            max_tokens=FLOW_MAX_TOKENS,
+            system=FLOW_SYSTEM_PROMPT,
+            tools=[FLOW_SPEC_TOOL],
+            tool_choice={"type": "tool", "name": FLOW_SPEC_TOOL["name"]},
             messages=[{"role": "user", "content": prompt}]
         )
         
-        response_text = response.content[0].text.strip()
-        
-        # Clean response of markdown code blocks if present
-        if "```json" in response_text:
-            response_text = response_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in response_text:
-            response_text = response_text.split("```")[1].split("```")[0].strip()
+        tool_use = next((block for block in response.content if block.type == "tool_use"), None)
+        if tool_use is None or response.stop_reason == "max_tokens":
+            print(f"❌ Flow design was not returned as a complete tool call (stop_reason: {response.stop_reason})")
+            return {
+                "error": "Failed to parse flow design: incomplete response",
+                "name": "Error Flow",
+                "_id": None
+            }
         
-        # Parse the JSON response
-        flow_spec = json.loads(response_text)
+        flow_spec = dict(tool_use.input)
         
         # Save to database
         flow_data = {
@@ -84,18 +110,10 @@ Return ONLY valid JSON with this structure:
         
         return flow_spec
         
-    except json.JSONDecodeError as e:
-        print(f"❌ Failed to parse flow design JSON: {str(e)}")
-        print(f"Raw response: {response_text}")
-        return {
-            "error": f"Failed to parse flow design: {str(e)}",
-            "name": "Error Flow",
-            "_id": None
-        }
     except Exception as e:
         print(f"❌ Error in flow_designer: {str(e)}")
         return {
             "error": f"Flow design failed: {str(e)}",
             "name": "Error Flow", 
             "_id": None
-        }
\ No newline at end of file
+        }
@@ -1,60 +1,142 @@
-from pymongo import MongoClient
+from pymongo import UpdateOne
 from bson import ObjectId
 import os
+import sys
 import json
+import orjson
 import asyncio
-from concurrent.futures import ProcessPoolExecutor
-import multiprocessing as mp
-import sys
-from io import StringIO
 import anthropic
 from datetime import datetime
+from mongo import get_db
+from agent_maker import agent_developer, agent_developer_async, agent_developer_claude4, agent_developer_claude4_async
 
-client = MongoClient(os.getenv('MONGODB_URI'))
-db = client.vibeflows
+db = get_db()
 claude_client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
 
+# Concurrent agent creations per parallel development; the work is LLM API calls,
+# so this tracks the provider rate limit rather than the CPU count
+AGENT_MAX_CONCURRENCY = int(os.getenv('AGENT_MAX_CONCURRENCY', '16'))
+
+# Only the node fields the sequential developer's id lookup, fallback and verification read
+FLOW_DEVELOP_PROJECTION = {'nodes.id': 1, 'nodes.type': 1, 'nodes.name': 1, 'nodes.agent_id': 1}
+
+# Seconds between checks for streamed Gemini output while agents are being created
+PROGRESS_POLL_INTERVAL = 0.1
+# Streamed output is sent per node once it reaches this many lines or this age (seconds)
+STREAM_BATCH_LINES = 16
+STREAM_FLUSH_INTERVAL = 1.0
+# Echo streamed agent maker output and per-node save details to the server's stdout (local debugging only)
+DEBUG_AGENT_OUTPUT = bool(os.getenv('VIBEFLOWS_DEBUG'))
+
+# Created agent_ids are written to the flow every this many agents, not only at the end
+AGENT_ID_FLUSH_EVERY = 5
+
+def _node_requirements(node):
+    """Serialize a flow node as JSON for the agent maker prompt"""
+    return orjson.dumps(node, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+
+def _agent_summary(agent_result):
+    """
+    Keep only what the final stream frame reports about a created agent; the full
+    spec (nodes, function code, schemas) is already stored in the agents collection.
+    """
+    return {'agent_id': agent_result.get('agent_id'), 'name': agent_result.get('name')}
+
+def _agent_id_updates(flow_oid, node_agent_ids):
+    """One targeted $set per node (matched by node id) instead of rewriting the whole flow"""
+    return [
+        UpdateOne({'_id': flow_oid}, {'$set': {'nodes.$[n].agent_id': agent_id}}, array_filters=[{'n.id': node_id}])
+        for node_id, agent_id in node_agent_ids.items()
+    ]
+
+def save_agent_ids(flow_oid, node_agent_ids):
+    """
+    Stamp agent_ids onto nodes while development is still running, so created
+    agents survive a crash before the flow is marked developed.
+    """
+    if not node_agent_ids:
+        return None
+    return db.flows.bulk_write(_agent_id_updates(flow_oid, node_agent_ids), ordered=False)
+
+def save_flow_development(flow_oid, node_agent_ids, agents_created_count, user_id=None):
+    """
+    Stamp any remaining agent_ids onto nodes and mark the flow developed.
+    Sends one targeted $set per node instead of rewriting the whole flow document.
+    """
+    ops = _agent_id_updates(flow_oid, node_agent_ids)
+    update = {'status': 'developed', 'agents_created_count': agents_created_count}
+    if user_id:
+        update['user_id'] = user_id
+    ops.append(UpdateOne({'_id': flow_oid}, {'$set': update}))
+    return db.flows.bulk_write(ops, ordered=True)
+
+async def _flush_agent_ids(flow_oid, node_agent_ids):
+    """
+    Save a batch of agent_ids off the event loop. Returns the ids still unsaved:
+    none on success, or the same batch so the final save retries it.
+    """
+    try:
+        await asyncio.to_thread(save_agent_ids, flow_oid, node_agent_ids)
+        return {}
+    except Exception as e:
+        print(f"⚠️ Could not save agent_ids yet, retrying at the end: {e}")
+        return node_agent_ids
+
+def load_undeveloped_agent_nodes(flow_oid):
+    """
+    Return {'name', 'agent_nodes'} for a flow, where agent_nodes are the agent nodes
+    still missing an agent_id. The filter runs in MongoDB so other nodes never cross the wire.
+    Returns None when the flow does not exist.
+    """
+    pipeline = [
+        {'$match': {'_id': flow_oid}},
+        {'$project': {
+            'name': 1,
+            'agent_nodes': {'$filter': {
+                'input': {'$ifNull': ['$nodes', []]},
+                'as': 'n',
+                'cond': {'$and': [
+                    {'$eq': ['$$n.type', 'agent']},
+                    {'$in': [{'$ifNull': ['$$n.agent_id', None]}, [None, '']]}
+                ]}
+            }}
+        }}
+    ]
+    return next(db.flows.aggregate(pipeline), None)
+
 def flow_developer(input_data):
     """
     This function is used to develop a flow.
     """
 
-    flow_id = input_data['flow_id']
+    flow_oid = ObjectId(input_data['flow_id'])  # Parsed once, reused by every query below
     user_id = input_data.get('user_id')
-    flow = db.flows.find_one({'_id': ObjectId(flow_id)})
-    print(flow)
-
-    new_flow = flow.copy()
+    flow = load_undeveloped_agent_nodes(flow_oid)
     if not flow:
         raise Exception('Flow not found')
-    
-    from agent_maker import agent_developer
-    
+
     agents_created = []
     agent_ids = []
+    node_agent_ids = {}  # node id -> agent_id not yet saved, written as targeted $set updates
     
-    for node in flow['nodes']:
-        if node['type'] == 'agent' and not node.get('agent_id'):
-            requirements = str(node)
-            agent_input = {'requirements': requirements}
-            result = agent_developer(agent_input)
-            agent_id = result['agent_id']
-            
-            # Update node with agent_id
-            for i, n in enumerate(new_flow['nodes']):
-                if n['id'] == node['id']:
-                    new_flow['nodes'][i]['agent_id'] = agent_id
-                    break
-            
-            agents_created.append(result)
-            agent_ids.append(agent_id)
+    for node in flow['agent_nodes']:
+        requirements = _node_requirements(node)
+        agent_input = {'requirements': requirements}
+        result = agent_developer(agent_input)
+        agent_id = result['agent_id']
+        
+        node_agent_ids[node['id']] = agent_id
+        
+        agents_created.append(result)
+        agent_ids.append(agent_id)
+        
+        # Save progress in batches so a crash doesn't lose created agents
+        if len(node_agent_ids) >= AGENT_ID_FLUSH_EVERY:
+            save_agent_ids(flow_oid, node_agent_ids)
+            node_agent_ids = {}
     
     # Update flow in database
-    new_flow['status'] = 'developed'
-    new_flow['agents_created_count'] = len(agent_ids)
-    if user_id:
-        new_flow['user_id'] = user_id
-    db.flows.replace_one({'_id': ObjectId(flow_id)}, new_flow)
+    save_flow_development(flow_oid, node_agent_ids, len(agent_ids), user_id)
     
     return {
         "status": "Flow developed",
@@ -63,424 +145,221 @@ def flow_developer(input_data):
         "development_complete": True
     }
 
+# Per-engine wording and result flags for the parallel developers
+PARALLEL_ENGINES = {
+    'claude4': {
+        'label': 'Agent',
+        'processing': 'CONCURRENTLY with Claude 4',
+        'complete': '🎉 PARALLEL DEVELOPMENT COMPLETE!',
+        'flags': {}
+    },
+    'gemini': {
+        'label': 'Gemini Agent',
+        'processing': 'with GEMINI in parallel',
+        'complete': '🎉 GEMINI PARALLEL DEVELOPMENT COMPLETE!',
+        'flags': {'multiprocessing': True, 'engine': 'gemini'}
+    }
+}
+
 async def flow_developer_streaming(input_data):
     """
-    Develops a flow by generating agents for each node using TRUE MULTIPROCESSING.
-    Streams updates as agents are created in separate processes.
+    Develops a flow by generating agents for each node CONCURRENTLY with Claude 4.
+    Agent creation is I/O bound, so all nodes run as asyncio tasks in this process
+    (bounded by AGENT_MAX_CONCURRENCY) and updates stream as each agent completes.
     """
-    flow_id = input_data['flow_id']
-    user_id = input_data.get('user_id')
-    flow = db.flows.find_one({'_id': ObjectId(flow_id)})
-    if not flow:
-        yield {"message": "❌ Flow not found", "type": "error"}
-        return
-
-    yield {"message": f"🔍 Found flow: {flow.get('name', 'Unnamed')}", "type": "status"}
-    new_flow = flow.copy()
-    
-    agents_created = []
-    agent_ids = []
-    
-    # Count agent nodes to process
-    agent_nodes = [node for node in flow['nodes'] if node['type'] == 'agent' and not node.get('agent_id')]
-    
-    if not agent_nodes:
-        yield {"message": "ℹ️ No agent nodes to process", "type": "info"}
-        return
-
-    yield {"message": f"🚀 Processing {len(agent_nodes)} agent nodes with MULTIPROCESSING...", "type": "status"}
-
-    # Prepare data for multiprocessing
-    node_data_list = [(node, i) for i, node in enumerate(agent_nodes)]
-    
-    # Determine number of processes (max 4 to avoid overwhelming the API)
-    max_workers = min(4, len(agent_nodes), mp.cpu_count())
-    yield {"message": f"⚡ Starting {max_workers} parallel processes...", "type": "parallel_start"}
-
-    try:
-        # Use ProcessPoolExecutor for true parallel processing
-        loop = asyncio.get_event_loop()
-        
-        with ProcessPoolExecutor(max_workers=max_workers) as executor:
-            # Submit all tasks to the process pool
-            futures = [
-                loop.run_in_executor(executor, create_agent_sync, node_data)
-                for node_data in node_data_list
-            ]
-            
-            yield {"message": f"📊 Submitted {len(futures)} agent creation jobs to process pool", "type": "status"}
-            
-            # Yield start messages for each process immediately
-            for i, (node, node_index) in enumerate(node_data_list):
-                yield {
-                    "message": f"🔨 [Process {node_index+1}] Starting agent creation for {node.get('name', node['id'])}",
-                    "type": "agent_stream",
-                    "node_id": node['id'],
-                    "progress": f"starting"
-                }
-            
-            # Wait for completion with periodic updates
-            completed = 0
-            successful = 0
-            failed = 0
-            
-            # Process results as they complete
-            for future in asyncio.as_completed(futures):
-                try:
-                    result = await future
-                    completed += 1
-                    
-                    # Stream the result message
-                    yield {
-                        "message": result['message'],
-                        "type": "process_update",
-                        "node_id": result['node']['id'],
-                        "progress": f"{completed}/{len(futures)}"
-                    }
-                    
-                    if result['success']:
-                        successful += 1
-                        agent_result = result['agent_result']
-                        agent_id = agent_result.get('agent_id')
-                        node = result['node']
-                        
-                        # Stream the captured output from agent_developer (Gemini streaming)
-                        if result.get('captured_output'):
-                            captured_lines = result['captured_output'].strip().split('\n')
-                            for line in captured_lines:
-                                if line.strip():  # Only yield non-empty lines
-                                    yield {
-                                        "message": line,
-                                        "type": "agent_stream",
-                                        "node_id": node['id'],
-                                        "progress": f"{completed}/{len(futures)}"
-                                    }
-                        
-                        # Update node with agent_id
-                        for j, n in enumerate(new_flow['nodes']):
-                            if n['id'] == node['id']:
-                                new_flow['nodes'][j]['agent_id'] = agent_id
-                                break
-
-                        agents_created.append(agent_result)
-                        agent_ids.append(agent_id)
-                        
-                        yield {
-                            "message": f"✅ [{completed}/{len(futures)}] Agent created: {agent_result.get('name', 'Unnamed')}",
-                            "type": "agent_complete",
-                            "node_id": node['id'],
-                            "agent_id": agent_id
-                        }
-                    else:
-                        failed += 1
-                        
-                        # Stream any captured output even for failed attempts
-                        if result.get('captured_output'):
-                            captured_lines = result['captured_output'].strip().split('\n')
-                            for line in captured_lines:
-                                if line.strip():  # Only yield non-empty lines
-                                    yield {
-                                        "message": line,
-                                        "type": "agent_stream_error",
-                                        "node_id": result['node']['id'],
-                                        "progress": f"{completed}/{len(futures)}"
-                                    }
-                        
-                        yield {
-                            "message": f"❌ [{completed}/{len(futures)}] Agent creation failed: {result.get('error', 'Unknown error')}",
-                            "type": "agent_error",
-                            "node_id": result['node']['id'],
-                            "error": result.get('error')
-                        }
-                        
-                    # Progress update
-                    if completed % 2 == 0 or completed == len(futures):
-                        yield {
-                            "message": f"📈 Progress: {completed}/{len(futures)} complete (✅ {successful}, ❌ {failed})",
-                            "type": "progress_update"
-                        }
-                        
-                except Exception as e:
-                    failed += 1
-                    yield {
-                        "message": f"❌ Process execution error: {str(e)}",
-                        "type": "process_error",
-                        "error": str(e)
-                    }
-
-    except Exception as e:
-        yield {
-            "message": f"❌ Multiprocessing setup error: {str(e)}",
-            "type": "multiprocessing_error",
-            "error": str(e)
-        }
-        return
-
-    # Update flow in database
-    try:
-        new_flow['status'] = 'developed'
-        new_flow['agents_created_count'] = len(agent_ids)
-        if user_id:
-            new_flow['user_id'] = user_id
-        db.flows.replace_one({'_id': ObjectId(flow_id)}, new_flow)
-        
-        yield {
-            "message": f"🎉 MULTIPROCESSING COMPLETE! ✅ {successful} successful, ❌ {failed} failed in parallel processes",
-            "type": "complete",
-            "agents_created": successful,
-            "agents_failed": failed,
-            "total_nodes": len(agent_nodes),
-            "agent_ids": agent_ids,
-            "multiprocessing": True,
-            "result": {
-                "status": "Flow developed",
-                "agents_created": agents_created,
-                "agent_ids": agent_ids,
-                "development_complete": True,
-                "parallel_processing": True,
-                "multiprocessing": True
-            }
-        }
-        
-    except Exception as e:
-        yield {
-            "message": f"❌ Error updating flow: {str(e)}",
-            "type": "database_error",
-            "error": str(e)
-        }
-
-def create_agent_sync(node_data):
-    """Synchronous function to create a single agent - runs in separate process"""
-    try:
-        # Import here to avoid pickling issues
-        from agent_maker import agent_developer
-        
-        node, node_index = node_data
-        agent_input = {'requirements': str(node)}
-        
-        # Capture stdout to get ALL output including the start message
-        old_stdout = sys.stdout
-        captured_output = StringIO()
-        sys.stdout = captured_output
-        
-        # Print the start message to captured output
-        print(f"🔨 [Process {node_index+1}] Starting agent creation for {node.get('name', node['id'])}")
-        
-        try:
-            # Create agent synchronously
-            result = agent_developer(agent_input)
-            
-            # Get the captured output
-            captured_text = captured_output.getvalue()
-            
-            return {
-                'node': node,
-                'node_index': node_index,
-                'agent_result': result,
-                'success': True,
-                'message': f"✅ [Process {node_index+1}] Agent '{result.get('name', 'Unnamed')}' created successfully",
-                'captured_output': captured_text  # Include the captured streaming output
-            }
-            
-        finally:
-            # Always restore stdout
-            sys.stdout = old_stdout
-            # Also print the captured output to the process stdout for local debugging
-            print(captured_text, end='')
-        
-    except Exception as e:
-        # Restore stdout in case of error
-        if 'old_stdout' in locals():
-            sys.stdout = old_stdout
-            
-        return {
-            'node': node,
-            'node_index': node_index,
-            'agent_result': None,
-            'success': False,
-            'error': str(e),
-            'message': f"❌ [Process {node_index+1}] Failed: {str(e)}",
-            'captured_output': ''
-        }
+    async for update in _flow_developer_parallel(input_data, 'claude4'):
+        yield update
 
 async def flow_developer_gemini(input_data):
     """
-    Develops a flow by generating agents for each node using TRUE MULTIPROCESSING with Gemini.
-    Streams updates as agents are created in separate processes.
+    Develops a flow by generating agents for each node in PARALLEL with Gemini.
+    All nodes run as asyncio tasks over the async Gemini agent maker (bounded by
+    AGENT_MAX_CONCURRENCY), and their output streams back as agents are created.
     """
-    flow_id = input_data['flow_id']
+    async for update in _flow_developer_parallel(input_data, 'gemini'):
+        yield update
+
+def _join_captured_output(captured_output):
+    """Collapse streamed worker output into one message, dropping blank lines"""
+    if not captured_output:
+        return ''
+    return '\n'.join(line for line in captured_output.strip().split('\n') if line.strip())
+
+async def _flow_developer_parallel(input_data, engine):
+    """Shared body of the parallel developers; engine is a PARALLEL_ENGINES key"""
+    config = PARALLEL_ENGINES[engine]
+    label = config['label']
+    flow_oid = ObjectId(input_data['flow_id'])  # Parsed once, reused by every query below
     user_id = input_data.get('user_id')
-    flow = db.flows.find_one({'_id': ObjectId(flow_id)})
+    flow = load_undeveloped_agent_nodes(flow_oid)
     if not flow:
         yield {"message": "❌ Flow not found", "type": "error"}
         return
 
     yield {"message": f"🔍 Found flow: {flow.get('name', 'Unnamed')}", "type": "status"}
-    new_flow = flow.copy()
     
     agents_created = []
     agent_ids = []
+    node_agent_ids = {}  # node id -> agent_id not yet saved, written as targeted $set updates
     
-    # Count agent nodes to process
-    agent_nodes = [node for node in flow['nodes'] if node['type'] == 'agent' and not node.get('agent_id')]
+    # Agent nodes to process
+    agent_nodes = flow['agent_nodes']
     
     if not agent_nodes:
         yield {"message": "ℹ️ No agent nodes to process", "type": "info"}
         return
 
-    yield {"message": f"🚀 Processing {len(agent_nodes)} agent nodes with GEMINI MULTIPROCESSING...", "type": "status"}
+    yield {"message": f"🚀 Processing {len(agent_nodes)} agent nodes {config['processing']}...", "type": "status"}
 
-    # Prepare data for multiprocessing
-    node_data_list = [(node, i) for i, node in enumerate(agent_nodes)]
-    
-    # Determine number of processes (max 4 to avoid overwhelming the API)
-    max_workers = min(4, len(agent_nodes), mp.cpu_count())
-    yield {"message": f"⚡ Starting {max_workers} parallel Gemini processes...", "type": "parallel_start"}
+    max_concurrent = min(AGENT_MAX_CONCURRENCY, len(agent_nodes))
+    yield {"message": f"⚡ Running up to {max_concurrent} agent creations in parallel...", "type": "parallel_start"}
 
+    semaphore = asyncio.Semaphore(AGENT_MAX_CONCURRENCY)
+    stream_buffers = {}  # node_index -> agent maker output not yet streamed, appended by the tasks
+    tasks = []
     try:
-        # Use ProcessPoolExecutor for true parallel processing
-        loop = asyncio.get_event_loop()
+        loop = asyncio.get_running_loop()
         
-        with ProcessPoolExecutor(max_workers=max_workers) as executor:
-            # Submit all tasks to the process pool
-            futures = [
-                loop.run_in_executor(executor, create_agent_gemini_sync, node_data)
-                for node_data in node_data_list
-            ]
-            
-            yield {"message": f"📊 Submitted {len(futures)} Gemini agent creation jobs to process pool", "type": "status"}
-            
-            # Yield start messages for each process immediately
-            for i, (node, node_index) in enumerate(node_data_list):
-                yield {
-                    "message": f"🔨 [Gemini Process {node_index+1}] Starting agent creation for {node.get('name', node['id'])}",
-                    "type": "agent_stream",
-                    "node_id": node['id'],
-                    "progress": f"starting"
-                }
+        # Start each node and announce it in the same pass; results come back keyed by index
+        for node_index, node in enumerate(agent_nodes):
+            tasks.append(asyncio.create_task(create_agent_async(node, node_index, semaphore, engine, user_id, stream_buffers)))
+            yield {
+                "message": f"🔨 [{label} {node_index+1}] Starting agent creation for {node.get('name', node['id'])}",
+                "type": "agent_stream",
+                "node_id": node['id'],
+                "progress": f"starting"
+            }
+        
+        yield {"message": f"📊 Submitted {len(tasks)} agent creation jobs", "type": "status"}
+        
+        # Wait for completion with periodic updates
+        progress_stride = max(1, len(agent_nodes) // 10)
+        completed = 0
+        successful = 0
+        failed = 0
+        pending = set(tasks)
+        last_flush = {}  # node_index -> loop time of its last streamed batch
+        
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=PROGRESS_POLL_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
             
-            # Wait for completion with periodic updates
-            completed = 0
-            successful = 0
-            failed = 0
+            # Stream agent maker output live, batched per node by line count or age
+            now = loop.time()
+            for node_index in list(stream_buffers):
+                buffered = stream_buffers[node_index]
+                if buffered.count('\n') < STREAM_BATCH_LINES and now - last_flush.setdefault(node_index, now) < STREAM_FLUSH_INTERVAL:
+                    continue
+                del stream_buffers[node_index]
+                last_flush[node_index] = now
+                text = _join_captured_output(buffered)
+                if text:
+                    yield {
+                        "message": text,
+                        "type": "agent_stream",
+                        "node_id": agent_nodes[node_index]['id'],
+                        "progress": f"{completed}/{len(tasks)}"
+                    }
             
             # Process results as they complete
-            for future in asyncio.as_completed(futures):
+            for task in done:
                 try:
-                    result = await future
+                    result = task.result()
                     completed += 1
+                    node = agent_nodes[result['node_index']]
+                    
+                    # Flush this node's remaining output ahead of its result
+                    text = _join_captured_output(stream_buffers.pop(result['node_index'], ''))
+                    if text:
+                        yield {
+                            "message": text,
+                            "type": "agent_stream",
+                            "node_id": node['id'],
+                            "progress": f"{completed}/{len(tasks)}"
+                        }
                     
                     # Stream the result message
                     yield {
                         "message": result['message'],
                         "type": "process_update",
-                        "node_id": result['node']['id'],
-                        "progress": f"{completed}/{len(futures)}"
+                        "node_id": node['id'],
+                        "progress": f"{completed}/{len(tasks)}"
                     }
                     
                     if result['success']:
                         successful += 1
                         agent_result = result['agent_result']
                         agent_id = agent_result.get('agent_id')
-                        node = result['node']
                         
-                        # Stream the captured output from agent_developer (Gemini streaming)
-                        if result.get('captured_output'):
-                            captured_lines = result['captured_output'].strip().split('\n')
-                            for line in captured_lines:
-                                if line.strip():  # Only yield non-empty lines
-                                    yield {
-                                        "message": line,
-                                        "type": "agent_stream",
-                                        "node_id": node['id'],
-                                        "progress": f"{completed}/{len(futures)}"
-                                    }
-                        
-                        # Update node with agent_id
-                        for j, n in enumerate(new_flow['nodes']):
-                            if n['id'] == node['id']:
-                                new_flow['nodes'][j]['agent_id'] = agent_id
-                                break
+                        node_agent_ids[node['id']] = agent_id
 
-                        agents_created.append(agent_result)
+                        agents_created.append(_agent_summary(agent_result))
                         agent_ids.append(agent_id)
                         
+                        # Save progress in batches so a crash doesn't lose created agents
+                        if len(node_agent_ids) >= AGENT_ID_FLUSH_EVERY:
+                            node_agent_ids = await _flush_agent_ids(flow_oid, node_agent_ids)
+                        
                         yield {
-                            "message": f"✅ [{completed}/{len(futures)}] Gemini Agent created: {agent_result.get('name', 'Unnamed')}",
+                            "message": f"✅ [{completed}/{len(tasks)}] {label} created: {agent_result.get('name', 'Unnamed')}",
                             "type": "agent_complete",
                             "node_id": node['id'],
                             "agent_id": agent_id
                         }
                     else:
                         failed += 1
-                        
-                        # Stream any captured output even for failed attempts
-                        if result.get('captured_output'):
-                            captured_lines = result['captured_output'].strip().split('\n')
-                            for line in captured_lines:
-                                if line.strip():  # Only yield non-empty lines
-                                    yield {
-                                        "message": line,
-                                        "type": "agent_stream_error",
-                                        "node_id": result['node']['id'],
-                                        "progress": f"{completed}/{len(futures)}"
-                                    }
-                        
                         yield {
-                            "message": f"❌ [{completed}/{len(futures)}] Gemini Agent creation failed: {result.get('error', 'Unknown error')}",
+                            "message": f"❌ [{completed}/{len(tasks)}] {label} creation failed: {result.get('error', 'Unknown error')}",
                             "type": "agent_error",
-                            "node_id": result['node']['id'],
+                            "node_id": node['id'],
                             "error": result.get('error')
                         }
                         
-                    # Progress update
-                    if completed % 2 == 0 or completed == len(futures):
+                    # Progress update, roughly every 10% of the work
+                    if completed % progress_stride == 0 or completed == len(tasks):
                         yield {
-                            "message": f"📈 Gemini Progress: {completed}/{len(futures)} complete (✅ {successful}, ❌ {failed})",
+                            "message": f"📈 Progress: {completed}/{len(tasks)} complete (✅ {successful}, ❌ {failed})",
                             "type": "progress_update"
                         }
                         
                 except Exception as e:
                     failed += 1
                     yield {
-                        "message": f"❌ Gemini Process execution error: {str(e)}",
+                        "message": f"❌ Agent task error: {str(e)}",
                         "type": "process_error",
                         "error": str(e)
                     }
 
     except Exception as e:
         yield {
-            "message": f"❌ Gemini Multiprocessing setup error: {str(e)}",
+            "message": f"❌ Parallel development setup error: {str(e)}",
             "type": "multiprocessing_error",
             "error": str(e)
         }
         return
+    finally:
+        # Stop outstanding agent creations if the consumer goes away
+        for task in tasks:
+            task.cancel()
 
     # Update flow in database
     try:
-        new_flow['status'] = 'developed'
-        new_flow['agents_created_count'] = len(agent_ids)
-        if user_id:
-            new_flow['user_id'] = user_id
-        db.flows.replace_one({'_id': ObjectId(flow_id)}, new_flow)
+        save_flow_development(flow_oid, node_agent_ids, len(agent_ids), user_id)
         
         yield {
-            "message": f"🎉 GEMINI MULTIPROCESSING COMPLETE! ✅ {successful} successful, ❌ {failed} failed in parallel processes",
+            "message": f"{config['complete']} ✅ {successful} successful, ❌ {failed} failed",
             "type": "complete",
             "agents_created": successful,
             "agents_failed": failed,
             "total_nodes": len(agent_nodes),
             "agent_ids": agent_ids,
-            "multiprocessing": True,
-            "engine": "gemini",
+            **config['flags'],
             "result": {
                 "status": "Flow developed",
                 "agents_created": agents_created,
                 "agent_ids": agent_ids,
                 "development_complete": True,
                 "parallel_processing": True,
-                "multiprocessing": True,
-                "engine": "gemini"
+                **config['flags']
             }
         }
         
@@ -491,90 +370,75 @@ async def flow_developer_gemini(input_data):
             "error": str(e)
         }
 
-def create_agent_gemini_sync(node_data):
-    """Synchronous function to create a single agent using Gemini - runs in separate process"""
-    try:
-        # Import here to avoid pickling issues
-        from agent_maker import agent_developer
-        
-        node, node_index = node_data
-        agent_input = {'requirements': str(node)}
-        
-        # Capture stdout to get ALL output including the start message
-        old_stdout = sys.stdout
-        captured_output = StringIO()
-        sys.stdout = captured_output
-        
-        # Print the start message to captured output
-        print(f"🔨 [Gemini Process {node_index+1}] Starting agent creation for {node.get('name', node['id'])}")
-        
+async def create_agent_async(node, node_index, semaphore, engine='claude4', user_id=None, stream_buffers=None):
+    """Create a single agent with the async agent maker for engine, bounded by semaphore"""
+    label = PARALLEL_ENGINES[engine]['label']
+    
+    def on_chunk(text):
+        # Buffer streamed output for the generator to send in batches
+        if stream_buffers is not None:
+            stream_buffers[node_index] = stream_buffers.get(node_index, '') + text
+        # Also echo to the real stdout for local debugging
+        if DEBUG_AGENT_OUTPUT:
+            sys.__stdout__.write(text)
+    
+    async with semaphore:
         try:
-            # Create agent synchronously using Gemini
-            result = agent_developer(agent_input)
-            
-            # Get the captured output
-            captured_text = captured_output.getvalue()
-            
+            requirements = _node_requirements(node)
+            if engine == 'gemini':
+                result = await agent_developer_async({'requirements': requirements}, on_chunk=on_chunk)
+            else:
+                result = await agent_developer_claude4_async({'requirements': requirements, 'user_id': user_id})
             return {
-                'node': node,
                 'node_index': node_index,
                 'agent_result': result,
                 'success': True,
-                'message': f"✅ [Gemini Process {node_index+1}] Agent '{result.get('name', 'Unnamed')}' created successfully",
-                'captured_output': captured_text  # Include the captured streaming output
+                'message': f"✅ [{label} {node_index+1}] Agent '{result.get('name', 'Unnamed')}' created successfully"
+            }
+        except Exception as e:
+            return {
+                'node_index': node_index,
+                'agent_result': None,
+                'success': False,
+                'error': str(e),
+                'message': f"❌ [{label} {node_index+1}] Failed: {str(e)}"
             }
-            
-        finally:
-            # Always restore stdout
-            sys.stdout = old_stdout
-            # Also print the captured output to the process stdout for local debugging
-            print(captured_text, end='')
-        
-    except Exception as e:
-        # Restore stdout in case of error
-        if 'old_stdout' in locals():
-            sys.stdout = old_stdout
-            
-        return {
-            'node': node,
-            'node_index': node_index,
-            'agent_result': None,
-            'success': False,
-            'error': str(e),
-            'message': f"❌ [Gemini Process {node_index+1}] Failed: {str(e)}",
-            'captured_output': ''
-        }
 
 async def flow_developer_claude4_sequential(input_data):
     """
     Develops a flow by generating agents for each node using Claude 4 SEQUENTIALLY.
     Uses agent_maker to create agents properly.
     """
-    flow_id = input_data['flow_id']
+    flow_oid = ObjectId(input_data['flow_id'])  # Parsed once, reused by every query below
     user_id = input_data.get('user_id')
-    flow = db.flows.find_one({'_id': ObjectId(flow_id)})
+    # Check for pending agent nodes first, so an already developed flow costs one small query
+    pending = load_undeveloped_agent_nodes(flow_oid)
     
-    if not flow:
+    if not pending:
         yield {"message": "❌ Flow not found", "type": "error"}
         return
 
-    yield {"message": f"🔍 Found flow: {flow.get('name', 'Unnamed')}", "type": "status"}
-    new_flow = flow.copy()
+    yield {"message": f"🔍 Found flow: {pending.get('name', 'Unnamed')}", "type": "status"}
     
-    agents_created = []
-    agent_ids = []
-    
-    # Count agent nodes to process
-    agent_nodes = [node for node in flow['nodes'] if node['type'] == 'agent' and not node.get('agent_id')]
+    agent_nodes = pending['agent_nodes']
     
     if not agent_nodes:
         yield {"message": "ℹ️ No agent nodes to process", "type": "info"}
         return
 
-    yield {"message": f"🚀 Processing {len(agent_nodes)} agent nodes SEQUENTIALLY with Claude 4 agent maker...", "type": "status"}
+    # The full node list is only needed for the by-position fallback and the save verification;
+    # it is this call's own projected read, so recording agent_ids on it touches nothing shared
+    flow = db.flows.find_one({'_id': flow_oid}, FLOW_DEVELOP_PROJECTION) or {}
+    nodes = flow.get('nodes', [])
+    node_index_by_id = {n.get('id'): i for i, n in enumerate(nodes)}
+    # Positions of agent nodes in the full list, for the by-position fallback
+    agent_positions = [i for i, n in enumerate(nodes) if n.get('type') == 'agent']
+    
+    agents_created = []
+    agent_ids = []
+    node_agent_ids = {}  # node id -> agent_id not yet saved, written as targeted $set updates
 
-    # Import agent_maker
-    from agent_maker import agent_developer_claude4
+    yield {"message": f"🚀 Processing {len(agent_nodes)} agent nodes SEQUENTIALLY with Claude 4 agent maker...", "type": "status"}
 
     # Process each node sequentially using agent_maker
     for i, node in enumerate(agent_nodes):
@@ -586,7 +450,7 @@ async def flow_developer_claude4_sequential(input_data):
         try:
             # Use agent_maker to create the agent
             agent_input = {
-                'requirements': str(node),
+                'requirements': _node_requirements(node),
                 'user_id': user_id
             }
             
@@ -596,42 +460,32 @@ async def flow_developer_claude4_sequential(input_data):
             result = agent_developer_claude4(agent_input)
             agent_id = result.get('agent_id')
             
-            print(f"🔍 Agent created with ID: {agent_id}")
-            print(f"🔍 Looking for node with ID: {node_id}")
+            if DEBUG_AGENT_OUTPUT:
+                print(f"🔍 Agent created with ID: {agent_id} for node ID: {node_id}")
             
-            # Update node with agent_id - FIXED approach
+            # Update node with agent_id
             node_updated = False
-            print(f"🔍 Searching for node_id '{node_id}' in {len(new_flow['nodes'])} total nodes")
-            
-            for j, n in enumerate(new_flow['nodes']):
-                current_node_id = n.get('id', '')
-                print(f"   Node {j}: id='{current_node_id}' type='{n.get('type', 'unknown')}'")
-                
-                if current_node_id == node_id:
-                    new_flow['nodes'][j]['agent_id'] = agent_id
-                    node_updated = True
-                    print(f"✅ SUCCESS: Updated node '{node_id}' with agent_id: {agent_id}")
-                    print(f"🔍 Node after update has keys: {list(new_flow['nodes'][j].keys())}")
-                    break
+            j = node_index_by_id.get(node_id)
+            if j is not None:
+                nodes[j]['agent_id'] = agent_id
+                node_agent_ids[node_id] = agent_id
+                node_updated = True
             
             if not node_updated:
                 print(f"❌ CRITICAL ERROR: Could not find node '{node_id}' in flow")
-                print(f"🔍 Available node IDs: {[n.get('id', 'NO_ID') for n in new_flow['nodes']]}")
-                print(f"🔍 Agent nodes IDs: {[n.get('id', 'NO_ID') for n in agent_nodes]}")
+                if DEBUG_AGENT_OUTPUT:
+                    print(f"🔍 Available node IDs: {[n.get('id', 'NO_ID') for n in nodes]}")
+                    print(f"🔍 Agent nodes IDs: {[n.get('id', 'NO_ID') for n in agent_nodes]}")
                 
                 # Emergency fallback - update by position if IDs don't match
-                if i < len(agent_nodes):
+                if i < len(agent_positions):
                     print(f"🚨 Emergency fallback: Updating node by position {i}")
-                    # Find the agent node in the full nodes list
-                    agent_node_count = 0
-                    for j, n in enumerate(new_flow['nodes']):
-                        if n.get('type') == 'agent':
-                            if agent_node_count == i:
-                                new_flow['nodes'][j]['agent_id'] = agent_id
-                                node_updated = True
-                                print(f"✅ Fallback SUCCESS: Updated agent node at position {i} with agent_id: {agent_id}")
-                                break
-                            agent_node_count += 1
+                    j = agent_positions[i]
+                    n = nodes[j]
+                    n['agent_id'] = agent_id
+                    node_agent_ids[n.get('id')] = agent_id
+                    node_updated = True
+                    print(f"✅ Fallback SUCCESS: Updated agent node at position {i} with agent_id: {agent_id}")
             
             if not node_updated:
                 print(f"💀 TOTAL FAILURE: Could not update any node with agent_id {agent_id}")
@@ -643,9 +497,13 @@ async def flow_developer_claude4_sequential(input_data):
                     "node_id": node_id
                 }
             
-            agents_created.append(result)
+            agents_created.append(_agent_summary(result))
             agent_ids.append(agent_id)
             
+            # Save progress in batches so a crash doesn't lose created agents
+            if len(node_agent_ids) >= AGENT_ID_FLUSH_EVERY:
+                node_agent_ids = await _flush_agent_ids(flow_oid, node_agent_ids)
+            
             yield {
                 "message": f"✅ [{i+1}/{len(agent_nodes)}] Agent created: {result.get('name', 'Unnamed')} (ID: {agent_id})",
                 "type": "agent_complete",
@@ -663,27 +521,22 @@ async def flow_developer_claude4_sequential(input_data):
 
     # Update flow in database
     try:
-        new_flow['status'] = 'developed'
-        new_flow['agents_created_count'] = len(agent_ids)
-        if user_id:
-            new_flow['user_id'] = user_id
-        
-        # Debug: Print what we're about to save
+        # Debug: Print what we're about to save (one line per node, so debug runs only)
         print(f"🔍 About to save flow with {len(agent_ids)} agents")
-        for i, node in enumerate(new_flow['nodes']):
-            if node.get('type') == 'agent':
-                agent_id = node.get('agent_id', 'MISSING')
-                print(f"   Node {i}: {node.get('name')} -> agent_id: {agent_id}")
+        if DEBUG_AGENT_OUTPUT:
+            for i, node in enumerate(nodes):
+                if node.get('type') == 'agent':
+                    print(f"   Node {i}: {node.get('name')} -> agent_id: {node.get('agent_id', 'MISSING')}")
         
-        result = db.flows.replace_one({'_id': ObjectId(flow_id)}, new_flow)
+        result = save_flow_development(flow_oid, node_agent_ids, len(agent_ids), user_id)
         print(f"✅ Flow updated in database (modified_count: {result.modified_count})")
         
         # Final verification - check what was actually saved
-        final_agent_count = len([n for n in new_flow['nodes'] if n.get('type') == 'agent' and n.get('agent_id')])
+        final_agent_count = len([n for n in nodes if n.get('type') == 'agent' and n.get('agent_id')])
         print(f"🎯 Memory verification: {final_agent_count}/{len(agent_nodes)} nodes have agent_ids")
         
         # Database verification - check what's actually in the database
-        saved_flow = db.flows.find_one({'_id': ObjectId(flow_id)})
+        saved_flow = db.flows.find_one({'_id': flow_oid}, {'nodes.type': 1, 'nodes.agent_id': 1})
         if saved_flow:
             saved_nodes = saved_flow.get('nodes', [])
             saved_agent_nodes = [n for n in saved_nodes if n.get('type') == 'agent']
@@ -1,21 +1,56 @@
-from pymongo import MongoClient
 from bson import ObjectId
-import os
 from edge_condition_checker import get_next_node_by_conditions
+from agent_runner import run_agent
+from mongo import get_db
 
-client = MongoClient(os.getenv('MONGODB_URI'))
-db = client.vibeflows
+db = get_db()
 
-def flow_runner(input_data):
+# Execution log entries are buffered and pushed to the run record every this many nodes
+LOG_FLUSH_EVERY = 5
+
+def _log_update(log_buffer, fields):
+    """Run record update that appends the buffered log entries and sets any fields in one write"""
+    update = {'$set': fields} if fields else {}
+    if log_buffer:
+        update['$push'] = {'execution_log': {'$each': log_buffer}}
+    return update
+
+def _load_flow(flow_oid, flow_cache):
+    """
+    Load a flow with its node and outgoing-edge indexes, once per top-level run.
+    Nested flow nodes that run the same sub-flow reuse the cached copy, while a new
+    run always reads the current definition (e.g. agent_ids added by development).
+    Returns (flow, node_by_id, edges_by_source), or None when the flow does not exist.
+    """
+    if flow_oid not in flow_cache:
+        flow = db.flows.find_one({'_id': flow_oid})
+        if not flow:
+            return None
+        
+        # Index nodes and outgoing edges once so each hop is a dict lookup
+        node_by_id = {node['id']: node for node in flow.get('nodes', [])}
+        edges_by_source = {}
+        for edge in flow.get('edges', []):
+            edges_by_source.setdefault(edge.get('source'), []).append(edge)
+        flow_cache[flow_oid] = (flow, node_by_id, edges_by_source)
+    return flow_cache[flow_oid]
+
+def flow_runner(input_data, flow_cache=None):
     """
     Run a flow by following the edges and using edge_condition_checker to validate conditions.
+    flow_cache is shared with nested flow runs so each flow is loaded once per run.
     """
+    if flow_cache is None:
+        flow_cache = {}
     flow_id = input_data['flow_id']
-    flow = db.flows.find_one({'_id': ObjectId(flow_id)})
+    # Parsed once and used as the cache key; nested flow nodes may already hold an ObjectId
+    flow_oid = flow_id if isinstance(flow_id, ObjectId) else ObjectId(flow_id)
+    loaded = _load_flow(flow_oid, flow_cache)
     user_input_data = input_data.get('input_data', {})
     
-    if not flow:
+    if not loaded:
         raise Exception('Flow not found')
+    flow, node_by_id, edges_by_source = loaded
     
     # Create a run record
     run_record = {
@@ -54,16 +89,13 @@ def flow_runner(input_data):
     current_data = user_input_data
     max_iterations = 20  # Prevent infinite loops
     iteration = 0
+    log_buffer = []  # Execution log entries not yet written to the run record
     
     while current_node_id and iteration < max_iterations:
         iteration += 1
         
         # Find current node
-        current_node = None
-        for node in nodes:
-            if node['id'] == current_node_id:
-                current_node = node
-                break
+        current_node = node_by_id.get(current_node_id)
         
         if not current_node:
             print(f"Node {current_node_id} not found")
@@ -73,7 +105,7 @@ def flow_runner(input_data):
         
         # Execute the node
         try:
-            node_output = execute_node(current_node, current_data)
+            node_output = execute_node(current_node, current_data, flow_cache)
             current_data = node_output
             
             # Log execution
@@ -86,14 +118,11 @@ def flow_runner(input_data):
                 'iteration': iteration
             }
             
-            # Update run record
-            db.runs.update_one(
-                {'_id': run_id},
-                {
-                    '$push': {'execution_log': execution_entry},
-                    '$set': {'current_data': current_data}
-                }
-            )
+            # Append to the run log at checkpoints; the data itself is only written as final_data
+            log_buffer.append(execution_entry)
+            if len(log_buffer) >= LOG_FLUSH_EVERY:
+                db.runs.update_one({'_id': run_id}, _log_update(log_buffer, None))
+                log_buffer = []
             
         except Exception as e:
             print(f"❌ Error executing node {current_node_id}: {str(e)}")
@@ -108,13 +137,8 @@ def flow_runner(input_data):
                 'iteration': iteration
             }
             
-            db.runs.update_one(
-                {'_id': run_id},
-                {
-                    '$push': {'execution_log': execution_entry},
-                    '$set': {'status': 'failed', 'error': str(e)}
-                }
-            )
+            log_buffer.append(execution_entry)
+            db.runs.update_one({'_id': run_id}, _log_update(log_buffer, {'status': 'failed', 'error': str(e)}))
             
             return {
                 'status': 'failed',
@@ -124,8 +148,14 @@ def flow_runner(input_data):
                 'last_node': current_node_id
             }
         
-        # Find next node using edge conditions
-        next_node_id = get_next_node_by_conditions(edges, current_node_id, current_data)
+        # Find next node using edge conditions; a lone unconditional edge needs no routing
+        outgoing = edges_by_source.get(current_node_id, [])
+        if not outgoing:
+            next_node_id = None
+        elif len(outgoing) == 1 and not (outgoing[0].get('condition') or '').strip():
+            next_node_id = outgoing[0].get('target')
+        else:
+            next_node_id = get_next_node_by_conditions(outgoing, current_node_id, current_data)
         
         if next_node_id:
             print(f"➡️  Next node: {next_node_id}")
@@ -138,7 +168,7 @@ def flow_runner(input_data):
     final_status = 'completed' if iteration < max_iterations else 'timeout'
     db.runs.update_one(
         {'_id': run_id},
-        {'$set': {'status': final_status, 'final_data': current_data}}
+        _log_update(log_buffer, {'status': final_status, 'final_data': current_data})
     )
     
     return {
@@ -149,7 +179,7 @@ def flow_runner(input_data):
         'iterations': iteration
     }
 
-def execute_node(node, input_data):
+def execute_node(node, input_data, flow_cache=None):
     """
     Execute a single node based on its type.
     """
@@ -158,7 +188,7 @@ def execute_node(node, input_data):
     if node_type == 'agent':
         return execute_agent_node(node, input_data)
     elif node_type == 'flow':
-        return run_flow_node(node, input_data)
+        return run_flow_node(node, input_data, flow_cache)
     else:
         # For other node types, just pass through the data
         return input_data
@@ -171,11 +201,10 @@ def execute_agent_node(node, input_data):
     if not agent_id:
         raise Exception(f"Agent node {node['id']} missing agent_id")
     
-    from agent_runner import run_agent
     result = run_agent(agent_id, input_data)
     return result
 
-def run_flow_node(node, input_data):
+def run_flow_node(node, input_data, flow_cache=None):
     """
     Execute a nested flow node.
     """
@@ -187,5 +216,5 @@ def run_flow_node(node, input_data):
         'flow_id': nested_flow_id,
         'input_data': input_data
     }
-    result = flow_runner(nested_input)
+    result = flow_runner(nested_input, flow_cache)
     return result.get('final_data', input_data)
\ No newline at end of file
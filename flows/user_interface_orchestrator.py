@@ -5,13 +5,16 @@ User Interface Orchestrator (Fixed)
 Fixed MongoDB ObjectId serialization issues for streaming responses.
 """
 
-import json
+import asyncio
+import orjson
 import os
+import time
+import traceback
 from typing import Dict, Any, List, AsyncGenerator
 from datetime import datetime, timezone, timedelta
 from dotenv import load_dotenv
-from pymongo import MongoClient
 from bson import ObjectId
+from mongo import get_db, ensure_indexes, ORCHESTRATOR_INDEXES
 
 # Import agents
 from agents.user_query_understanding import get_user_understanding
@@ -23,12 +26,22 @@ from agents.n8n_workflow_developer import create_n8n_workflow
 # Load environment variables
 load_dotenv()
 
-# MongoDB setup
-mongo_client = MongoClient(os.getenv("MONGODB_URI"))
-db = mongo_client[os.getenv("MONGODB_DATABASE")]
+# Message timestamps are stored in PST
+PST = timezone(timedelta(hours=-8))
+
+# MongoDB setup (shared, explicitly pooled client)
+db = get_db(os.getenv("MONGODB_DATABASE"))
 messages_collection = db["messages"]
 users_collection = db["users"]
 
+# Chat history, latest-message-per-type and user lookups need their compound indexes;
+# built only when ENSURE_INDEXES=1 so importing never blocks on MongoDB
+if os.getenv("ENSURE_INDEXES") == "1":
+    try:
+        ensure_indexes(db, ORCHESTRATOR_INDEXES)
+    except Exception as e:
+        print(f"⚠️ Could not create orchestrator indexes: {e}")
+
 VIBEFLOWS_FLOW = {
     "flow_name": "VibeFlows Core Experience Flow",
     "entry_point": "user_query_understanding",
@@ -71,84 +84,96 @@ VIBEFLOWS_FLOW = {
     ]
 }
 
-def save_message(chat_id: str, text: str, sender: str, message_type: str = "text", 
-                mermaid: str = None, json_data: dict = None) -> Dict[str, Any]:
+def build_message_doc(chat_id: str, text: str, sender: str, message_type: str = "text", 
+                      mermaid: str = None, json_data: dict = None) -> Dict[str, Any]:
     """
-    Save message to MongoDB and return the message document (not ObjectId).
+    Build a message document ready for MongoDB (timestamp still a datetime).
     
     Returns:
-        Dict containing the complete message document for streaming
+        The message document, or None if required fields are missing
     """
+    # Ensure required fields are not None/empty
+    if not chat_id or not text or not sender:
+        print(f"⚠️ WARNING - Invalid message data: chat_id={chat_id}, text={text}, sender={sender}")
+        return None
+    
+    # Use timezone-aware timestamp (PST/PDT)
+    current_time = datetime.now(PST)
+    
+    # Create message document
+    message_doc = {
+        "id": f"{sender}-{time.time_ns() // 1_000_000}",
+        "chatId": str(chat_id),  # Ensure string
+        "text": str(text),       # Ensure string
+        "sender": str(sender),   # Ensure string
+        "timestamp": current_time,
+        "type": str(message_type)  # Ensure string
+    }
+    
+    # Add optional fields only if they exist and clean them
+    if mermaid:
+        message_doc["mermaid"] = str(mermaid)
+    if json_data:
+        # Ensure json_data is actually serializable
+        try:
+            orjson.dumps(json_data)
+            message_doc["json"] = json_data
+        except (TypeError, ValueError) as e:
+            print(f"⚠️ json_data not serializable, converting to string: {e}")
+            message_doc["json"] = str(json_data)
+    
+    return message_doc
+
+def _streamable_message(message_doc: Dict[str, Any]) -> Dict[str, Any]:
+    """JSON-safe version of a saved message doc for the response stream."""
+    streamable = {key: value for key, value in message_doc.items() if key != "_id"}
+    streamable["timestamp"] = message_doc["timestamp"].isoformat()
+    
+    # Double-check serialization
     try:
-        # Ensure required fields are not None/empty
-        if not chat_id or not text or not sender:
-            print(f"⚠️ WARNING - Invalid message data: chat_id={chat_id}, text={text}, sender={sender}")
-            return None
-        
-        # Use timezone-aware timestamp (PST/PDT)
-        user_timezone = timezone(timedelta(hours=-8))  # PST timezone
-        current_time = datetime.now(user_timezone)
-        
-        # Create message document
-        message_doc = {
-            "id": f"{sender}-{int(current_time.timestamp() * 1000)}",
-            "chatId": str(chat_id),  # Ensure string
-            "text": str(text),       # Ensure string
-            "sender": str(sender),   # Ensure string
-            "timestamp": current_time,
-            "type": str(message_type)  # Ensure string
-        }
-        
-        # Add optional fields only if they exist and clean them
-        if mermaid:
-            message_doc["mermaid"] = str(mermaid)
-        if json_data:
-            # Ensure json_data is actually serializable
-            try:
-                json.dumps(json_data)
-                message_doc["json"] = json_data
-            except (TypeError, ValueError) as e:
-                print(f"⚠️ json_data not serializable, converting to string: {e}")
-                message_doc["json"] = str(json_data)
-        
-        print(f"🔍 DEBUG - Saving message: {message_doc}")
-        
-        # Create a copy for MongoDB (with datetime object)
-        db_doc = message_doc.copy()
-        
-        # Save to MongoDB
-        result = messages_collection.insert_one(db_doc)
-        
-        # Convert timestamp to ISO string for JSON serialization in the return value
-        message_doc["timestamp"] = current_time.isoformat()
+        orjson.dumps(streamable)
+        return streamable
+    except Exception as e:
+        print(f"❌ Message doc not serializable: {e}")
+        # Fallback to basic message
+        return {key: streamable[key] for key in ("id", "chatId", "text", "sender", "timestamp", "type")}
+
+def flush_messages(message_docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Save built message docs to MongoDB in one insert_many and return them for streaming.
+    
+    Returns:
+        The saved message documents (not ObjectIds), in the order given
+    """
+    message_docs = [doc for doc in message_docs if doc]
+    if not message_docs:
+        return []
+    
+    try:
+        print(f"🔍 DEBUG - Saving {len(message_docs)} messages: {[doc['id'] for doc in message_docs]}")
         
-        # Ensure no MongoDB ObjectId or other BSON types leak through
-        if "_id" in message_doc:
-            del message_doc["_id"]
+        # Save to MongoDB (with datetime objects); insert_many adds _id in place, which
+        # _streamable_message leaves out of the single copy it builds for the stream
+        result = messages_collection.insert_many(message_docs, ordered=False)
+        print(f"✅ Messages saved with IDs: {result.inserted_ids}")
         
-        # Double-check serialization
-        try:
-            json.dumps(message_doc)
-        except Exception as e:
-            print(f"❌ Message doc not serializable: {e}")
-            # Fallback to basic message
-            return {
-                "id": f"{sender}-{int(current_time.timestamp() * 1000)}",
-                "chatId": str(chat_id),
-                "text": str(text),
-                "sender": str(sender),
-                "timestamp": current_time.isoformat(),
-                "type": str(message_type)
-            }
-        
-        print(f"✅ Message saved with ID: {result.inserted_id}")
-        return message_doc
+        return [_streamable_message(doc) for doc in message_docs]
         
     except Exception as e:
-        print(f"❌ Error saving message: {e}")
-        import traceback
+        print(f"❌ Error saving messages: {e}")
         traceback.print_exc()
-        return None
+        return []
+
+def save_message(chat_id: str, text: str, sender: str, message_type: str = "text", 
+                mermaid: str = None, json_data: dict = None) -> Dict[str, Any]:
+    """
+    Save message to MongoDB and return the message document (not ObjectId).
+    
+    Returns:
+        Dict containing the complete message document for streaming
+    """
+    saved = flush_messages([build_message_doc(chat_id, text, sender, message_type, mermaid, json_data)])
+    return saved[0] if saved else None
 
 def get_user_data(user_id: str) -> Dict[str, Any]:
     """Get user data from database."""
@@ -158,12 +183,15 @@ def get_user_data(user_id: str) -> Dict[str, Any]:
         print(f"Error getting user data: {e}")
         return None
 
+# Message fields convert_messages_to_llm_format reads
+LLM_MESSAGE_PROJECTION = {"_id": 0, "id": 1, "sender": 1, "type": 1, "text": 1, "mermaid": 1}
+
 def get_chat_messages(chat_id: str) -> List[Dict[str, Any]]:
-    """Get all messages for a chat."""
+    """Get all messages for a chat, with only the fields the LLM conversion reads."""
     try:
         messages = list(
             messages_collection
-            .find({"chatId": chat_id})
+            .find({"chatId": chat_id}, LLM_MESSAGE_PROJECTION)
             .sort("timestamp", 1)
         )
         return messages
@@ -184,30 +212,44 @@ def convert_messages_to_llm_format(messages: List[Dict[str, Any]]) -> List[Dict[
             if msg["type"] == "mermaid" and msg["mermaid"]:
                 content = "DECRIPTION" + "\n" + msg["text"] + "MERMAID FLOWCHART:\n" + str(msg["mermaid"])
             elif "json" in msg["type"]:
-                content = "DESCRIPTION:\n" + msg["text"] + "\nJSON DATA:\n" + json.dumps(msg["json"])
+                # Only reference JSON payloads; the latest of each type reaches the
+                # agents through get_context (last_understanding, last_n8n_workflow)
+                content = "DESCRIPTION:\n" + msg["text"] + f"\n<{msg['type']} id={msg.get('id')}>"
             else:
                 content = msg["text"]
             llm_messages.append({"role": "assistant", "content": content})
     return llm_messages
 
+# Lookup indexes per flow, keyed by id(flow); the flow is kept alongside so its id is never reused
+_FLOW_INDEXES = {}
+
+def _flow_index(flow: Dict[str, Any]) -> Dict[str, Any]:
+    """Node-by-id and edges-by-source lookups for a flow, built once per flow."""
+    entry = _FLOW_INDEXES.get(id(flow))
+    if entry is None:
+        edges_by_source = {}
+        for edge in flow["edges"]:
+            edges_by_source.setdefault(edge["from"], []).append(edge)
+        entry = _FLOW_INDEXES[id(flow)] = (flow, {
+            "nodes": {node["id"]: node for node in flow["nodes"]},
+            "edges_by_source": edges_by_source
+        })
+    return entry[1]
+
 def get_node_by_id(flow: Dict[str, Any], node_id: str) -> Dict[str, Any]:
     """Get a node from the flow by its ID."""
-    for node in flow["nodes"]:
-        if node["id"] == node_id:
-            return node
-    return None
+    return _flow_index(flow)["nodes"].get(node_id)
 
 def get_next_nodes(flow: Dict[str, Any], current_node_id: str) -> List[Dict[str, Any]]:
     """Get possible next nodes from current node."""
     next_nodes = []
-    for edge in flow["edges"]:
-        if edge["from"] == current_node_id:
-            next_node = get_node_by_id(flow, edge["to"])
-            if next_node:
-                next_nodes.append({
-                    "node": next_node,
-                    "condition": edge.get("condition")
-                })
+    for edge in _flow_index(flow)["edges_by_source"].get(current_node_id, []):
+        next_node = get_node_by_id(flow, edge["to"])
+        if next_node:
+            next_nodes.append({
+                "node": next_node,
+                "condition": edge.get("condition")
+            })
     return next_nodes
 
 def get_available_agents_from_flow(flow: Dict[str, Any]) -> List[str]:
@@ -218,6 +260,11 @@ def get_available_agents_from_flow(flow: Dict[str, Any]) -> List[str]:
             agents.add(node["agent_name"])
     return list(agents)
 
+def parse_llm_json(text: str) -> Any:
+    """Parse JSON from an LLM reply, dropping a surrounding markdown code fence if present."""
+    text = text.strip().removeprefix("```json").removeprefix("```").removesuffix("```")
+    return orjson.loads(text)
+
 def execute_agent(agent_name: str, context: Dict[str, Any], action: str = None) -> Dict[str, Any]:
     """Execute a specific agent with given context."""
     
@@ -228,11 +275,9 @@ def execute_agent(agent_name: str, context: Dict[str, Any], action: str = None)
             # If result is a string (JSON), parse it
             if isinstance(result, str):
                 try:
-                    # Clean markdown code blocks if present
-                    cleaned_result = result.replace("```json", "").replace("```", "")
-                    result = json.loads(cleaned_result)
+                    result = parse_llm_json(result)
                     print(f"🔍 DEBUG - Result of {agent_name}\n: {result}")
-                except json.JSONDecodeError as e:
+                except orjson.JSONDecodeError as e:
                     print(f"Error parsing understanding result: {e}")
                     return {"error": f"Failed to parse understanding result: {e}"}
             
@@ -260,102 +305,127 @@ def execute_agent(agent_name: str, context: Dict[str, Any], action: str = None)
     except Exception as e:
         return {"error": f"Agent {agent_name} failed: {str(e)}"}
 
-async def run_flow(flow: Dict[str, Any], context: Dict[str, Any]) -> List[Dict[str, Any]]:
-    """Execute the flow starting from entry point and return all messages as a list."""
+def build_agent_result_messages(agent_result: Dict[str, Any], context: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Build the message docs for one agent's result and update the context with it."""
+    docs = []
     
-    current_node_id = flow["entry_point"]
+    if "understanding_result" in agent_result:
+        docs.append(build_message_doc(
+            context["chat_id"],
+            "Requirements analysis completed",
+            "ai",
+            "user_understanding_json",
+            json_data=agent_result["understanding_result"]
+        ))
+        context["current_understanding"] = agent_result["understanding_result"]
+    
+    if "mermaid_diagram" in agent_result:
+        docs.append(build_message_doc(
+            context["chat_id"],
+            "This is a design for workflow. Please let us know more details so we update the design and build you a workflow to solve your specific task.",
+            "ai",
+            "mermaid",
+            mermaid=agent_result["mermaid_diagram"]
+        ))
+        context["current_mermaid"] = agent_result["mermaid_diagram"]
+    
+    if "n8n_workflow_json" in agent_result:
+        docs.append(build_message_doc(
+            context["chat_id"],
+            "N8N workflow has been generated successfully. You can copy and paste this into your N8N instance or it may have been automatically created if you have N8N credentials configured.",
+            "ai",
+            "n8n_workflow_json",
+            json_data=agent_result["n8n_workflow_json"]
+        ))
+        context["current_n8n_workflow"] = agent_result["n8n_workflow_json"]
+    
+    if "user_response_text" in agent_result:
+        docs.append(build_message_doc(
+            context["chat_id"],
+            agent_result["user_response_text"],
+            "ai",
+            "simple_text"
+        ))
+    
+    return [doc for doc in docs if doc]
+
+async def execute_flow(flow: Dict[str, Any], context: Dict[str, Any]) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    Execute the flow starting from entry point, yielding messages as each step saves them.
+    
+    Nodes that follow the same node only read context from earlier steps, so each
+    step runs its agents concurrently and saves their messages together in edge order.
+    """
+    
+    current_node_ids = [flow["entry_point"]]
     max_iterations = 10
     iteration = 0
-    responses = []
     
-    while iteration < max_iterations:
-        print(f"🔄 Iteration {iteration + 1}: Processing node '{current_node_id}'")
+    while current_node_ids and iteration < max_iterations:
+        print(f"🔄 Iteration {iteration + 1}: Processing nodes {current_node_ids}")
 
-        current_node = get_node_by_id(flow, current_node_id)
-        if not current_node:
-            print(f"❌ Node '{current_node_id}' not found")
+        current_nodes = []
+        for node_id in current_node_ids:
+            node = get_node_by_id(flow, node_id)
+            if node:
+                current_nodes.append(node)
+            else:
+                print(f"❌ Node '{node_id}' not found")
+        if not current_nodes:
             break
 
-        next_nodes = get_next_nodes(flow, current_node_id)
-        next_node_id = next_nodes[0]["node"]["id"] if next_nodes else None
-
-        if current_node["type"] == "agent":
-            agent_name = current_node["agent_name"]
-            action = current_node.get("action")
-            
-            print(f"🤖 Executing agent: {agent_name}")
-            if action:
-                print(f"   Action: {action}")
-            
-            agent_result = execute_agent(agent_name, context, action)
-            
+        agent_nodes = [node for node in current_nodes if node["type"] == "agent"]
+        for node in agent_nodes:
+            print(f"🤖 Executing agent: {node['agent_name']}")
+            if node.get("action"):
+                print(f"   Action: {node['action']}")
+        
+        # Agent SDKs are synchronous, so sibling agents run side by side in threads
+        agent_results = await asyncio.gather(*(
+            asyncio.to_thread(execute_agent, node["agent_name"], context, node.get("action"))
+            for node in agent_nodes
+        ))
+        
+        failed = False
+        step_docs = []
+        for node, agent_result in zip(agent_nodes, agent_results):
             if "error" in agent_result:
                 print(f"❌ Agent error: {agent_result['error']}")
-                error_doc = save_message(
+                step_docs.append(build_message_doc(
                     context["chat_id"],
-                    f"Error in {agent_name}: {agent_result['error']}",
+                    f"Error in {node['agent_name']}: {agent_result['error']}",
                     "ai",
                     "simple_text"
-                )
-                if error_doc:
-                    responses.append(error_doc)
-                break
+                ))
+                failed = True
+                continue
             
-            if "understanding_result" in agent_result:
-                understanding_doc = save_message(
-                    context["chat_id"],
-                    "Requirements analysis completed",
-                    "ai",
-                    "user_understanding_json",
-                    json_data=agent_result["understanding_result"]
-                )
-                if understanding_doc:
-                    responses.append(understanding_doc)
-                context["current_understanding"] = agent_result["understanding_result"]
-            
-            if "mermaid_diagram" in agent_result:
-                mermaid_doc = save_message(
-                    context["chat_id"],
-                    "This is a design for workflow. Please let us know more details so we update the design and build you a workflow to solve your specific task.",
-                    "ai",
-                    "mermaid",
-                    mermaid=agent_result["mermaid_diagram"]
-                )
-                if mermaid_doc:
-                    responses.append(mermaid_doc)
-                context["current_mermaid"] = agent_result["mermaid_diagram"]
-            
-            if "n8n_workflow_json" in agent_result:
-                workflow_doc = save_message(
-                    context["chat_id"],
-                    "N8N workflow has been generated successfully. You can copy and paste this into your N8N instance or it may have been automatically created if you have N8N credentials configured.",
-                    "ai",
-                    "n8n_workflow_json",
-                    json_data=agent_result["n8n_workflow_json"]
-                )
-                if workflow_doc:
-                    responses.append(workflow_doc)
-                context["current_n8n_workflow"] = agent_result["n8n_workflow_json"]
-            
-            if "user_response_text" in agent_result:
-                print(f"🔍 DEBUG - Saving user response: {agent_result['user_response_text']}")
-                response_doc = save_message(
-                    context["chat_id"],
-                    agent_result["user_response_text"],
-                    "ai",
-                    "simple_text"
-                )
-                if response_doc:
-                    responses.append(response_doc)
+            step_docs.extend(build_agent_result_messages(agent_result, context))
         
-        if not next_node_id:
-            print("🏁 No more nodes to process")
+        # One round trip for every message this step produced, streamed right away
+        for message_doc in flush_messages(step_docs):
+            yield message_doc
+        
+        if failed:
             break
 
-        current_node_id = next_node_id
+        # Every node reachable from this step, once each, in edge order
+        current_node_ids = list(dict.fromkeys(
+            next_node["node"]["id"]
+            for node in current_nodes
+            for next_node in get_next_nodes(flow, node["id"])
+        ))
+        if not current_node_ids:
+            print("🏁 No more nodes to process")
         iteration += 1
 
-    return responses
+# Message type -> (context key, message field) for the latest AI message of each type
+LAST_MESSAGE_FIELDS = {
+    "mermaid": ("last_mermaid", "mermaid"),
+    "user_understanding_json": ("last_understanding", "json"),
+    "simple_text": ("last_ai_response", "text"),
+    "n8n_workflow_json": ("last_n8n_workflow", "json"),
+}
 
 def get_context(user_query) -> Dict[str, Any]:
     """Get the last relevant messages from the chat."""
@@ -379,23 +449,26 @@ def get_context(user_query) -> Dict[str, Any]:
     }
     
     try:
-        # Get all messages sorted by timestamp
-        messages = list(
-            messages_collection
-            .find({"chatId": chat_id})
-            .sort("timestamp", -1)
-        )
+        # Only the latest AI message of each type is needed, so MongoDB picks them
+        # and returns one small document per type instead of the whole chat
+        latest = messages_collection.aggregate([
+            {"$match": {
+                "chatId": chat_id,
+                "sender": {"$in": ["ai", "assistant"]},
+                "type": {"$in": list(LAST_MESSAGE_FIELDS)}
+            }},
+            {"$sort": {"timestamp": -1}},
+            {"$group": {
+                "_id": "$type",
+                "mermaid": {"$first": "$mermaid"},
+                "json": {"$first": "$json"},
+                "text": {"$first": "$text"}
+            }}
+        ])
         
-        for msg in messages:
-            if msg.get("sender") == "ai" or msg.get("sender") == "assistant":
-                if msg.get("type") == "mermaid" and not context["last_mermaid"]:
-                    context["last_mermaid"] = msg.get("mermaid")
-                elif msg.get("type") == "user_understanding_json" and not context["last_understanding"]:
-                    context["last_understanding"] = msg.get("json")
-                elif msg.get("type") == "simple_text" and not context["last_ai_response"]:
-                    context["last_ai_response"] = msg.get("text")
-                elif msg.get("type") == "n8n_workflow_json" and not context["last_n8n_workflow"]:
-                    context["last_n8n_workflow"] = msg.get("json")
+        for msg in latest:
+            context_key, field = LAST_MESSAGE_FIELDS[msg["_id"]]
+            context[context_key] = msg.get(field)
         
         return context
         
@@ -404,15 +477,15 @@ def get_context(user_query) -> Dict[str, Any]:
         # Return the base context with required fields even in case of error
         return context
 
-async def run_flow(user_query: Dict[str, Any]) -> List[Dict[str, Any]]:
+async def run_flow(user_query: Dict[str, Any]) -> AsyncGenerator[Dict[str, Any], None]:
     """
-    Main entry point: Execute the complete workflow with user query and return all responses.
+    Main entry point: Execute the complete workflow with user query and stream the responses.
     
     Args:
         user_query: Message document with chatId, text, sender_id, etc.
         
-    Returns:
-        List of response documents
+    Yields:
+        Response documents, as soon as each one is saved
     """
     
     # Get required fields
@@ -421,33 +494,36 @@ async def run_flow(user_query: Dict[str, Any]) -> List[Dict[str, Any]]:
     user_id = user_query.get("user_id")
     
     if not chat_id:
-        return [{
+        yield {
             "type": "error",
             "text": "Error: chatId required in message document",
-            "id": f"error-{int(datetime.now().timestamp() * 1000)}",
+            "id": f"error-{time.time_ns() // 1_000_000}",
             "chatId": chat_id or "unknown",
             "sender": "ai",
-            "timestamp": datetime.now(timezone(timedelta(hours=-8))).isoformat()
-        }]
+            "timestamp": datetime.now(PST).isoformat()
+        }
+        return
 
     if not user_message:
-        return [{
+        yield {
             "type": "error", 
             "text": "Error: text required in message document",
-            "id": f"error-{int(datetime.now().timestamp() * 1000)}",
+            "id": f"error-{time.time_ns() // 1_000_000}",
             "chatId": chat_id,
             "sender": "ai",
-            "timestamp": datetime.now(timezone(timedelta(hours=-8))).isoformat()
-        }]
+            "timestamp": datetime.now(PST).isoformat()
+        }
+        return
     if not user_id:
-        return [{
+        yield {
             "type": "error", 
             "text": "Error: user_id required in message document",
-            "id": f"error-{int(datetime.now().timestamp() * 1000)}",
+            "id": f"error-{time.time_ns() // 1_000_000}",
             "chatId": chat_id,
             "sender": "ai",
-            "timestamp": datetime.now(timezone(timedelta(hours=-8))).isoformat()
-        }]
+            "timestamp": datetime.now(PST).isoformat()
+        }
+        return
     
     # Get last relevant messages for context
     context = get_context(user_query)
@@ -456,13 +532,14 @@ async def run_flow(user_query: Dict[str, Any]) -> List[Dict[str, Any]]:
         print(f"🚀 Starting workflow execution for chat: {chat_id}")
         print(f"📝 User message: {user_message}")
         
-        # Execute the complete flow and get all responses
-        responses = await run_flow(VIBEFLOWS_FLOW, context)
+        # Execute the complete flow, passing each response on as it is saved
+        async for response in execute_flow(VIBEFLOWS_FLOW, context):
+            yield response
         print(f"🎉 Workflow execution completed for chat: {chat_id}")
-        return responses
         
     except Exception as e:
         error_response = f"I apologize, but I encountered an error: {str(e)}"
         print(f"❌ Error in run_flow: {e}")
         error_doc = save_message(chat_id, error_response, "ai", "simple_text")
-        return [error_doc] if error_doc else []
\ No newline at end of file
+        if error_doc:
+            yield error_doc
\ No newline at end of file
@@ -0,0 +1,69 @@
+"""
+Shared MongoDB Connection
+=========================
+One lazily created MongoClient per process with an explicitly bounded
+connection pool, so every module reuses the same sockets instead of
+opening its own pool. Scripts get their .env loaded on first use.
+"""
+
+import os
+from functools import lru_cache
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+
+@lru_cache(maxsize=1)
+def get_client() -> MongoClient:
+    """Return the process-wide MongoClient (created on first use)."""
+    load_dotenv()  # No-op when the environment is already configured
+    return MongoClient(
+        os.getenv("MONGODB_URI"),
+        maxPoolSize=int(os.getenv("MONGODB_MAX_POOL_SIZE", "50")),
+        minPoolSize=int(os.getenv("MONGODB_MIN_POOL_SIZE", "10")),
+        maxIdleTimeMS=60000,  # Recycle idle sockets before NATs/load balancers drop them
+        serverSelectionTimeoutMS=3000,
+        retryWrites=True,
+        compressors="zstd,zlib",  # Wire compression for text-heavy messages and flows
+        connect=False  # Defer connecting until the first operation
+    )
+
+
+def get_db(name=None):
+    """Return the named database (vibeflows by default) on the shared client."""
+    return get_client()[name or "vibeflows"]
+
+
+# Indexes behind the flow/agent lookups: latest flows per user, developed
+# flows by agent count, developed flows only, and agents created in a time window.
+# Each entry is (keys, create_index options).
+INDEXES = {
+    "flows": [
+        ([("user_id", 1), ("created_at", -1)], {}),
+        ([("status", 1), ("agents_created_count", 1), ("created_at", -1)], {}),
+        ([("status", 1), ("created_at", -1)], {"partialFilterExpression": {"status": "developed"}}),
+    ],
+    "agents": [
+        ([("created_at", 1)], {}),
+    ],
+}
+
+# Indexes for the orchestrator's database (MONGODB_DATABASE): chatId-keyed messages
+# read in timestamp order and as the latest message per type, and users by user_id.
+ORCHESTRATOR_INDEXES = {
+    "messages": [
+        ([("chatId", 1), ("timestamp", 1)], {}),
+        ([("chatId", 1), ("type", 1), ("timestamp", -1)], {}),
+    ],
+    "users": [
+        ([("user_id", 1)], {}),
+    ],
+}
+
+
+def ensure_indexes(db=None, indexes=None):
+    """Create the shared indexes (or the given index set); a no-op when they already exist."""
+    if db is None:
+        db = get_db()
+    for collection, specs in (indexes or INDEXES).items():
+        for keys, options in specs:
+            db[collection].create_index(keys, **options)
@@ -112,11 +112,14 @@ def get_n8n_workflows(input_data):
         
         n8n_base_url = n8n_url_cred["value"].rstrip('/')
         
-        # Get user's n8n workflows, sorted by most recent
+        # Get user's n8n workflows, sorted by most recent.
+        # Fetch one extra document so we know whether more exist without another query.
         workflows = list(db.n8n_workflows.find(
             {"user_id": clean_user_id}, 
             {"_id": 1, "n8n_response": 1, "created_at": 1}
-        ).sort("created_at", -1).limit(limit))
+        ).sort("created_at", -1).limit(limit + 1))
+        has_more = len(workflows) > limit
+        workflows = workflows[:limit]
         
         workflow_urls = []
         for workflow in workflows:
@@ -139,6 +142,7 @@ def get_n8n_workflows(input_data):
         return {
             "workflows": workflow_urls,
             "count": len(workflow_urls),
+            "has_more": has_more,
             "n8n_base_url": n8n_base_url,
             "message": f"✅ Found {len(workflow_urls)} N8N workflow(s) for user"
         }
@@ -198,10 +202,9 @@ def get_flow_and_agents(input_data):
     try:
         # Convert flow_id to ObjectId if it's a string
         if isinstance(flow_id, str):
-            try:
-                flow_object_id = ObjectId(flow_id)
-            except:
+            if not ObjectId.is_valid(flow_id):
                 return {"error": "Invalid flow_id format", "message": "❌ Invalid flow_id format"}
+            flow_object_id = ObjectId(flow_id)
         else:
             flow_object_id = flow_id
         
@@ -236,14 +239,12 @@ def get_flow_and_agents(input_data):
         # Convert agent_ids to ObjectIds for database query
         agent_object_ids = []
         for agent_id in agent_ids:
-            try:
-                if isinstance(agent_id, str):
-                    agent_object_ids.append(ObjectId(agent_id))
-                else:
-                    agent_object_ids.append(agent_id)
-            except:
+            if isinstance(agent_id, str):
                 # Skip invalid agent_ids
-                continue
+                if ObjectId.is_valid(agent_id):
+                    agent_object_ids.append(ObjectId(agent_id))
+            else:
+                agent_object_ids.append(agent_id)
         
         # Fetch agents from database
         agents = list(db.agents.find(
@@ -3,18 +3,12 @@
 Quick test to see if our fixes work with a minimal example
 """
 
-import os
 import asyncio
-from pymongo import MongoClient
 from bson import ObjectId
-from dotenv import load_dotenv
+from mongo import get_db
 
-# Load environment variables from .env file
-load_dotenv()
-
-# Connect to MongoDB
-client = MongoClient(os.getenv("MONGODB_URI"))
-db = client.vibeflows
+# Shared MongoDB connection (also loads .env)
+db = get_db()
 
 async def quick_test():
     """Quick test with timeout"""
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Test local edge condition evaluation and its LLM fallback (no API calls)
+"""
+
+import edge_condition_checker
+from edge_condition_checker import _evaluate_locally, check_edge_condition, get_next_node_by_conditions
+
+OUTPUT = {
+    "action_type": "create_flow",
+    "confidence": 0.9,
+    "needs_clarification": False,
+    "items": [1, 2],
+    "empty": [],
+    "text": "hello",
+    "count": 1,
+    "nothing": None,
+}
+
+def test_simple_conditions_evaluate_locally():
+    assert _evaluate_locally("output.action_type === 'create_flow'", OUTPUT) is True
+    assert _evaluate_locally("output.action_type !== 'create_flow'", OUTPUT) is False
+    assert _evaluate_locally("output.confidence > 0.8 && !output.needs_clarification", OUTPUT) is True
+    assert _evaluate_locally("output.missing === undefined", OUTPUT) is True
+
+def test_length_matches_js():
+    assert _evaluate_locally("output.items.length > 0", OUTPUT) is True
+    assert _evaluate_locally("output.empty.length > 0", OUTPUT) is False
+    assert _evaluate_locally("output.text.length === 5", OUTPUT) is True
+
+def test_js_truthiness_and_precedence():
+    assert _evaluate_locally("output.empty && true", OUTPUT) is True  # [] is truthy in JS
+    assert _evaluate_locally("!output.action_type === false", OUTPUT) is True  # (!a) === false
+    assert _evaluate_locally("!(output.action_type === 'run_flow')", OUTPUT) is True
+
+def test_null_and_undefined_are_distinct():
+    assert _evaluate_locally("output.nothing === undefined", OUTPUT) is False
+    assert _evaluate_locally("output.missing === null", OUTPUT) is False
+    assert _evaluate_locally("output.nothing === null", OUTPUT) is True
+    assert _evaluate_locally("output.missing !== undefined", OUTPUT) is False
+    assert _evaluate_locally("output.nothing == undefined", OUTPUT) is True  # loose equality matches both
+
+def test_undecidable_conditions_need_llm():
+    assert _evaluate_locally("output.text.toUpperCase === 'HELLO'", OUTPUT) is None
+    assert _evaluate_locally("output.count == '1'", OUTPUT) is None  # loose equality coerces
+    assert _evaluate_locally("output.missing > 3", OUTPUT) is None
+    assert _evaluate_locally("output.missing.length > 0", OUTPUT) is None
+    assert _evaluate_locally("0 < output.confidence < 1", OUTPUT) is None
+    assert _evaluate_locally("output.items.includes(1)", OUTPUT) is None
+
+def test_runtime_failures_fall_back_to_llm(monkeypatch):
+    calls = []
+    def fake_llm(conditions, output_data):
+        calls.append(conditions)
+        return [True] * len(conditions)
+    monkeypatch.setattr(edge_condition_checker, "_llm_check_edge_conditions", fake_llm)
+
+    assert check_edge_condition("output.count == '1'", OUTPUT) is True
+    edges = [
+        {"source": "a", "target": "b", "condition": "output.missing > 3"},
+        {"source": "a", "target": "c", "condition": "output.action_type === 'respond'"},
+    ]
+    assert get_next_node_by_conditions(edges, "a", OUTPUT) == "b"
+    assert calls == [["output.count == '1'"], ["output.missing > 3"]]
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
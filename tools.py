@@ -48,7 +48,7 @@ def get_tool_schemas():
         },
         {
             "name": "flow_developer_gemini",
-            "description": "Develops agents inside the flow using Gemini with multiprocessing",
+            "description": "Develops agents inside the flow using Gemini in parallel",
             "input_schema": {
                 "type": "object",
                 "properties": {
@@ -312,7 +312,7 @@ def get_recent_conversation(chat_id: str, limit: int = 10) -> list:
     """Get recent conversation history"""
     try:
         messages = list(
-            db.messages.find({'chat_id': chat_id})
+            db.messages.find({'chat_id': chat_id}, {'content': 0})
             .sort('timestamp', -1)
             .limit(limit)
         )
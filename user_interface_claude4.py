@@ -1,25 +1,96 @@
 import os
 import json
+import orjson
 from bson import ObjectId
 from datetime import datetime
-from pymongo import MongoClient
 import asyncio
+import inspect
 import anthropic
 from typing import AsyncGenerator, Dict, Any, List
+from pymongo.write_concern import WriteConcern
 from concurrent.futures import ThreadPoolExecutor
 import time
 
+try:
+    import redis
+except ImportError:  # Redis is optional; history reads go straight to Mongo without it
+    redis = None
+
 # === TOOL IMPORTS ===
 from tools import get_tool_schemas, TOOLS
 
 # === DATABASE ===
-client = MongoClient(os.getenv("MONGODB_URI"))
-db = client.vibeflows
+from mongo import get_db
+db = get_db()
+
+# === CACHE ===
+# Chat history is re-read on every request; cache it when REDIS_URL is configured.
+# Writes bump a per-chat version that is part of the key, the TTL is only a safety net.
+cache = redis.Redis.from_url(os.getenv("REDIS_URL")) if redis and os.getenv("REDIS_URL") else None
+HISTORY_CACHE_TTL = 60
+
+
+# Fields needed to rebuild the conversation; skips the potentially large `content` payloads
+HISTORY_PROJECTION = {"_id": 0, "role": 1, "type": 1, "text": 1}
 
+# Compound index that covers HISTORY_PROJECTION, so history reads never touch the documents
+HISTORY_INDEX = [("chat_id", 1), ("timestamp", 1), ("role", 1), ("type", 1), ("text", 1)]
+_history_index_ready = None
 
 # === HELPERS ===
-def save_message(chat_id, role, msg_type, text, content=None):
-    db.messages.insert_one({
+def _ensure_history_index():
+    """Create the covering history index once per process; hint it only if it exists"""
+    global _history_index_ready
+    if _history_index_ready is None:
+        try:
+            db.messages.create_index(HISTORY_INDEX, name="chat_history_covered")
+            _history_index_ready = True
+        except Exception as e:
+            print(f"⚠️ Could not create chat history index: {e}")
+            _history_index_ready = False
+    return _history_index_ready
+
+def _history_cache_key(chat_id, limit):
+    version = cache.get(f"chat:{chat_id}:version") or b"0"
+    return f"chat:{chat_id}:v{version.decode()}:last:{limit}"
+
+def _invalidate_chat_history(chat_id):
+    if cache is None:
+        return
+    try:
+        cache.incr(f"chat:{chat_id}:version")
+    except Exception as e:
+        print(f"⚠️ Chat history cache invalidation failed: {e}")
+
+def load_chat_history(chat_id, limit=8):
+    """Return the last `limit` messages of a chat in chronological order"""
+    cache_key = None
+    if cache is not None:
+        try:
+            cache_key = _history_cache_key(chat_id, limit)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return orjson.loads(cached)
+        except Exception as e:
+            print(f"⚠️ Chat history cache read failed: {e}")
+            cache_key = None
+
+    cursor = db.messages.find({"chat_id": chat_id}, HISTORY_PROJECTION)
+    if _ensure_history_index():
+        # Pin the plan so the optimizer cannot fall back to a single-field index under skew
+        cursor = cursor.hint(HISTORY_INDEX)
+    history = list(cursor.sort("timestamp", -1).limit(limit))[::-1]
+
+    if cache_key is not None:
+        try:
+            cache.setex(cache_key, HISTORY_CACHE_TTL, orjson.dumps(history))
+        except Exception as e:
+            print(f"⚠️ Chat history cache write failed: {e}")
+    return history
+
+def queue_message(pending, chat_id, role, msg_type, text, content=None):
+    """Queue a message for the end-of-turn batch write (see flush_messages)"""
+    pending.append({
         "chat_id": chat_id,
         "role": role,
         "type": msg_type,
@@ -28,16 +99,64 @@ def save_message(chat_id, role, msg_type, text, content=None):
         "timestamp": datetime.now()
     })
 
+def flush_messages(pending, chat_id):
+    """Persist all messages queued during a turn with a single unordered insert_many"""
+    if not pending:
+        return
+    try:
+        # Chat transcripts trade journal durability for latency (acknowledged by the primary only)
+        messages = db.messages.with_options(write_concern=WriteConcern(w=1, j=False))
+        messages.insert_many(pending, ordered=False, bypass_document_validation=True)
+    except Exception as e:
+        print(f"❌ Failed to save {len(pending)} chat messages: {e}")
+    finally:
+        pending.clear()
+        _invalidate_chat_history(chat_id)
+
+# Flow developer update type -> (message prefix, SSE event type); anything else is "tool_stream"
+FLOW_UPDATE_EVENTS = {
+    "agent_stream": ("🤖 ", "agent_ai_stream"),  # Streamed agent maker output
+    "agent_stream_error": ("❌ ", "agent_ai_error"),  # Output from a failed agent creation
+    "process_update": ("", "flow_progress"),
+    "agent_complete": ("", "flow_progress"),
+    "progress_update": ("", "flow_progress"),
+}
+
+# Start and result messages for streaming tools
+STREAMING_TOOL_MESSAGES = {
+    "flow_developer": (
+        "🚀 Starting flow development with Claude 4 sequential processing...",
+        "✅ Flow development completed with Claude 4 sequential agent creation"
+    ),
+    "flow_developer_gemini": (
+        "🚀 Starting flow development with Gemini parallel agent creation...",
+        "✅ Flow development completed with Gemini parallel agent creation"
+    ),
+}
+
 def _stream_event(text, type="status", final=False):
-    return f"data: {json.dumps({'type': type, 'message': text, 'final': final})}\n\n"
+    """Encode an SSE frame once, here, so the HTTP layer only writes bytes"""
+    return b"data: " + orjson.dumps({'type': type, 'message': text, 'final': final}) + b"\n\n"
 
 # === CLAUDE SETUP ===
 claude_client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
 
-async def run_claude_agent_flow(user_query: str, chat_id: str, user_id: str) -> AsyncGenerator[str, None]:
+async def run_claude_agent_flow(user_query: str, chat_id: str, user_id: str) -> AsyncGenerator[bytes, None]:
     """
     Claude agent flow with streaming thoughts and responses - Fixed with proper N8N timeouts
+    
+    Messages produced during the turn are written in one batch when the turn ends,
+    including when the client disconnects mid-stream.
     """
+    pending_messages = []
+    try:
+        async for event in _run_agent_turn(user_query, chat_id, user_id, pending_messages):
+            yield event
+    finally:
+        flush_messages(pending_messages, chat_id)
+
+async def _run_agent_turn(user_query: str, chat_id: str, user_id: str, pending_messages: list) -> AsyncGenerator[bytes, None]:
+    """Single agent turn; queues its chat messages into `pending_messages`"""
     
     if not user_query.strip():
         # Handle empty query
@@ -48,7 +167,7 @@ async def run_claude_agent_flow(user_query: str, chat_id: str, user_id: str) ->
                 messages=[{"role": "user", "content": "Hello! Please greet me as an automation assistant."}]
             )
             greeting = response.content[0].text
-            save_message(chat_id, "assistant", "text", greeting)
+            queue_message(pending_messages, chat_id, "assistant", "text", greeting)
             yield _stream_event(greeting, final=True)
             return
         except Exception as e:
@@ -66,7 +185,7 @@ Available tools:
 - query_analyzer: Analyze user queries for intent and requirements
 - flow_designer: Design automation flows from requirements  
 - flow_developer: Develop agents within flows using Claude 4 sequential processing
-- flow_developer_gemini: Develop agents within flows using Gemini with multiprocessing
+- flow_developer_gemini: Develop agents within flows using Gemini in parallel
 - n8n_developer: Generate and deploy n8n workflows (may take up to 3 minutes)
 - mongodb_tool: Query MongoDB collections (agents, flows, runs, n8n_workflows only)
 - check_credentials: Check if user has access to required credentials
@@ -93,8 +212,8 @@ If API call fails because of missing credentials, send the message with key "mis
 Be conversational and share your thought process as you work through the automation challenge.
 Note: N8N deployments can take up to 3 minutes - this is normal for complex workflows."""
 
-    # Get conversation history
-    previous_messages = list(db.messages.find({"chat_id": chat_id}).sort("timestamp", 1))[-8:]
+    # Get conversation history - only the last 8 messages and only the fields used below
+    previous_messages = load_chat_history(chat_id, limit=8)
     
     # Build messages array
     messages = []
@@ -164,7 +283,6 @@ Note: N8N deployments can take up to 3 minutes - this is normal for complex work
                             
                             # Stream all text chunks immediately for real-time experience
                             yield _stream_event(text_chunk, "thought_stream")
-                            await asyncio.sleep(0.02)  # Small delay between chunks
                         
                         elif event.delta.type == "input_json_delta":
                             # Throttle tool input updates to avoid spam
@@ -196,7 +314,7 @@ Note: N8N deployments can take up to 3 minutes - this is normal for complex work
                 
                 # Save Claude's reasoning
                 if current_text.strip():
-                    save_message(chat_id, "assistant", "text", current_text)
+                    queue_message(pending_messages, chat_id, "assistant", "text", current_text)
                     yield _stream_event("💡 Reasoning complete", "reasoning_done")
                     await asyncio.sleep(0.3)
                 
@@ -244,37 +362,23 @@ Note: N8N deployments can take up to 3 minutes - this is normal for complex work
                     
                     try:
                         if tool_name in TOOLS:
-                            # Special handling for streaming flow_developer
-                            if tool_name == "flow_developer":
-                                yield _stream_event("🚀 Starting flow development with Claude 4 sequential processing...", "executing")
-                                
-                                from flow_developer import flow_developer_claude4_sequential
+                            # Streaming tools (the flow developers) are async generators: frame each update as it arrives
+                            if inspect.isasyncgenfunction(TOOLS[tool_name]):
+                                start_msg, result_msg = STREAMING_TOOL_MESSAGES.get(
+                                    tool_name,
+                                    (f"🚀 Starting {tool_name}...", f"✅ {tool_name} completed")
+                                )
+                                yield _stream_event(start_msg, "executing")
                                 
                                 # Stream flow development updates in real-time
-                                async for update in flow_developer_claude4_sequential(tool_input):
+                                async for update in TOOLS[tool_name](tool_input):
                                     message = update.get("message", "")
-                                    update_type = update.get("type", "status")
-                                    
-                                    # Format different types of updates differently
-                                    if update_type == "agent_stream":
-                                        # This is the captured Gemini streaming output
-                                        yield _stream_event(f"🤖 {message}", "agent_ai_stream")
-                                    elif update_type == "agent_stream_error":
-                                        # This is captured output from failed agent creation
-                                        yield _stream_event(f"❌ {message}", "agent_ai_error")
-                                    elif update_type in ["process_update", "agent_complete", "progress_update"]:
-                                        # Regular flow development updates
-                                        yield _stream_event(message, "flow_progress")
-                                    else:
-                                        # Other messages
-                                        yield _stream_event(message, "tool_stream")
-                                    
-                                    await asyncio.sleep(0.05)  # Small delay for readability
+                                    prefix, event_type = FLOW_UPDATE_EVENTS.get(update.get("type", "status"), ("", "tool_stream"))
+                                    yield _stream_event(prefix + message, event_type)
                                 
                                 # Set result for Claude
-                                result_msg = "✅ Flow development completed with Claude 4 sequential agent creation"
                                 yield _stream_event(result_msg, "tool_result")
-                                save_message(chat_id, "assistant", "text", result_msg)
+                                queue_message(pending_messages, chat_id, "assistant", "text", result_msg)
                                 
                                 tool_results.append({
                                     "tool_use_id": tool_id,
@@ -287,11 +391,7 @@ Note: N8N deployments can take up to 3 minutes - this is normal for complex work
                             def run_tool_sync():
                                 """Run tool synchronously in thread"""
                                 if tool_name == "n8n_developer":
-                                    # Check credentials first
-                                    from pymongo import MongoClient
-                                    import os
-                                    db = MongoClient(os.getenv("MONGODB_URI")).vibeflows
-                                    
+                                    # Check credentials first (reuses the shared connection pool)
                                     print(f"🔍 Checking N8N credentials for user_id: {user_id}")
                                     
                                     # Simple fix: Replace URL-encoded pipe with actual pipe
@@ -314,7 +414,7 @@ Note: N8N deployments can take up to 3 minutes - this is normal for complex work
                                     return TOOLS[tool_name](tool_input)
                             
                             # Execute tool with proper timeout
-                            loop = asyncio.get_event_loop()
+                            loop = asyncio.get_running_loop()
                             with ThreadPoolExecutor(max_workers=1) as executor:
                                 result = await asyncio.wait_for(
                                     loop.run_in_executor(executor, run_tool_sync),
@@ -379,7 +479,7 @@ Note: N8N deployments can take up to 3 minutes - this is normal for complex work
                                 result_msg = result.get("summary") or result.get("message") or f"✅ {tool_name} completed"
                             
                             yield _stream_event(result_msg, "tool_result")
-                            save_message(chat_id, "assistant", "text", result_msg)
+                            queue_message(pending_messages, chat_id, "assistant", "text", result_msg)
                             await asyncio.sleep(0.2)
                             
                             # Store result for Claude with better formatting
@@ -426,7 +526,7 @@ Note: N8N deployments can take up to 3 minutes - this is normal for complex work
                             yield _stream_event(suggestion_msg, "suggestion")
                             
                             # Store timeout info for potential fallback
-                            save_message(chat_id, "system", "timeout", "n8n_deployment_timeout", {
+                            queue_message(pending_messages, chat_id, "system", "timeout", "n8n_deployment_timeout", {
                                 "tool_input": tool_input,
                                 "timestamp": datetime.now().isoformat()
                             })
@@ -458,7 +558,7 @@ Note: N8N deployments can take up to 3 minutes - this is normal for complex work
                         
                         error_msg = f"❌ Error in {tool_name}: {str(e)}"
                         yield _stream_event(error_msg, "error")
-                        save_message(chat_id, "assistant", "text", error_msg)
+                        queue_message(pending_messages, chat_id, "assistant", "text", error_msg)
                         tool_results.append({
                             "tool_use_id": tool_id,
                             "type": "tool_result",